@@ -0,0 +1,122 @@
+"""
+Behaviour check for the endpoint pool, against mock servers on this machine.
+
+    python benchmarks/bench_pool.py
+
+Runs a few scenarios and fails on the first one that doesn't hold:
+- failover: with one server always answering HTTP 500, every request still gets its
+  answer from the healthy one and the failing one is taken out of rotation
+- cooldown: once the failing server recovers, it is back in rotation after 'cooldown'
+- all down: a call tries each server once, then raises instead of retrying the same one
+- least_outstanding: concurrent requests are spread over both servers, within each one's cap
+- latency: with strategy="latency", requests go to the server that answers faster
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from endpoint_pool import EndpointPool
+from mock_server import MockOpenAIServer
+
+
+def ask(pool, served_by):
+    """One small request through the pool; notes which server answered it."""
+    def send(endpoint):
+        response = endpoint.client.chat.completions.create(
+            model="local-model", messages=[{"role": "user", "content": "Say something."}], max_tokens=5)
+        served_by.append(endpoint.base_url)
+        return response
+    return pool.call(send)
+
+
+def check_failover(requests, failure_threshold):
+    with MockOpenAIServer(latency=0.0, failure_rate=1.0) as failing, MockOpenAIServer(latency=0.0) as healthy:
+        # The failing server is listed first, so it is the one picked while nothing is known yet
+        pool = EndpointPool.from_specs([failing.base_url, healthy.base_url], failure_threshold=failure_threshold, cooldown=60)
+        served_by = []
+        for _ in range(requests):
+            ask(pool, served_by)
+        assert served_by == [healthy.base_url] * requests, "every request should be answered by the healthy server"
+        assert failing.stats()["requests"] == failure_threshold, \
+            f"the failing server got {failing.stats()['requests']} requests, expected {failure_threshold} before it sits out"
+        assert not pool.endpoints[0].is_healthy(time.monotonic()), "the failing server should be out of rotation"
+    print(f"Failover: {requests} requests answered by the healthy server, the failing one sat out after {failure_threshold}: ok")
+
+
+def check_cooldown(cooldown):
+    with MockOpenAIServer(latency=0.0, failure_rate=1.0) as flaky, MockOpenAIServer(latency=0.0) as healthy:
+        pool = EndpointPool.from_specs([flaky.base_url, healthy.base_url], failure_threshold=1, cooldown=cooldown)
+        served_by = []
+        ask(pool, served_by)
+        assert not pool.endpoints[0].is_healthy(time.monotonic()), "the failing server should be out of rotation"
+        flaky.failure_rate = 0.0
+        ask(pool, served_by)
+        assert flaky.stats()["requests"] == 1, "a server sitting out shouldn't get requests"
+        time.sleep(cooldown)
+        for _ in range(4):
+            ask(pool, served_by)
+        assert flaky.base_url in served_by, "the recovered server should be back in rotation after the cooldown"
+    print(f"Cooldown: the recovered server is back in rotation after {cooldown}s: ok")
+
+
+def check_all_down():
+    with MockOpenAIServer(latency=0.0, failure_rate=1.0) as first, MockOpenAIServer(latency=0.0, failure_rate=1.0) as second:
+        pool = EndpointPool.from_specs([first.base_url, second.base_url], cooldown=60)
+        try:
+            ask(pool, [])
+        except Exception:
+            pass
+        else:
+            raise AssertionError("a call should raise when every server fails")
+        tried = first.stats()["requests"], second.stats()["requests"]
+        assert tried == (1, 1), f"each server should be tried once per call, got {tried}"
+    print("All servers down: each tried once, then the error is raised: ok")
+
+
+def check_least_outstanding(requests, max_in_flight):
+    with MockOpenAIServer(latency=0.2) as first, MockOpenAIServer(latency=0.2) as second:
+        pool = EndpointPool.from_specs([first.base_url, second.base_url], default_max_in_flight=max_in_flight)
+        served_by = []
+        with ThreadPoolExecutor(max_workers=requests) as executor:
+            list(executor.map(lambda _: ask(pool, served_by), range(requests)))
+        counts = [served_by.count(server.base_url) for server in (first, second)]
+        assert counts == [requests // 2, requests - requests // 2], f"requests should be spread evenly, got {counts}"
+        peaks = [server.stats()["max_in_flight"] for server in (first, second)]
+        assert max(peaks) <= max_in_flight, f"a server had {max(peaks)} requests in flight, cap is {max_in_flight}"
+    print(f"Least outstanding: {requests} concurrent requests split {counts[0]}/{counts[1]}, at most {max(peaks)} in flight: ok")
+
+
+def check_latency(requests):
+    with MockOpenAIServer(latency=0.3) as slow, MockOpenAIServer(latency=0.0) as fast:
+        pool = EndpointPool.from_specs([slow.base_url, fast.base_url], strategy="latency")
+        served_by = []
+        # Two at once, so each server gets one and the pool learns both latencies
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda _: ask(pool, served_by), range(2)))
+        for _ in range(requests):
+            ask(pool, served_by)
+        assert served_by[2:] == [fast.base_url] * requests, "after warming up, requests should go to the faster server"
+    print(f"Latency routing: {requests} requests after warm-up all went to the faster server: ok")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=8, help="requests sent per scenario")
+    parser.add_argument('--cooldown', type=float, default=0.5, help="seconds a failing server sits out in the cooldown check")
+    args = parser.parse_args(argv)
+
+    check_failover(args.requests, failure_threshold=2)
+    check_cooldown(args.cooldown)
+    check_all_down()
+    check_least_outstanding(args.requests, max_in_flight=2)
+    check_latency(args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Prefill benchmark for the prompt layout: how much sooner the first token arrives when
+every prompt opens with the same instructions + book bible (shared_prefix=True) than
+with the per-call part first (shared_prefix=False).
+
+    python benchmarks/bench_prefix.py                                 # against the mock server
+    python benchmarks/bench_prefix.py --base-url http://localhost:1234/v1 --prompts 20
+
+The mock server simulates prompt processing at --prefill-tokens-per-sec with a small
+prefix cache. Against a real server (llama.cpp, vLLM, LM Studio) the numbers are the
+real prefill, as long as its prompt cache is switched on.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from openai import OpenAI
+
+from prompts import PromptBook
+
+FILLER = (
+    "Mira follows the old captain's map down to the cellar beneath the lighthouse, where "
+    "Tobin is waiting with a lantern and a question neither of them wants to answer. "
+)
+
+
+def book_prompts(shared_prefix, count, bible_words, run_id):
+    """The outline and chapter prompts of a made-up book, in the order the pipeline sends them."""
+    prompts = PromptBook(shared_prefix=shared_prefix)
+    premise = " ".join((FILLER * (bible_words // len(FILLER.split()) + 1)).split()[:bible_words])
+    prompts.update(story_idea=f"A lighthouse keeper finds a map (run {run_id})", tone="mysterious", premise=premise)
+    messages = []
+    for i in range(2, count + 2):
+        if i % 2:
+            messages.append(prompts.messages("chapter", chapter_number=i, outline=f"- Chapter {i}: " + FILLER * 3))
+        else:
+            messages.append(prompts.messages("outline", chapter_number=i, chapter_content=FILLER * 4,
+                                             previous_outline=FILLER * 2, earlier_story=FILLER))
+    return prompts, messages
+
+
+def first_token_times(client, model, messages):
+    """Sends the prompts one after another and returns each one's time to first token."""
+    times = []
+    for prompt in messages:
+        started = time.perf_counter()
+        stream = client.chat.completions.create(model=model, messages=prompt, max_tokens=1, stream=True)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                break
+        times.append(time.perf_counter() - started)
+        stream.close()
+    return times
+
+
+def run(base_url, args):
+    client = OpenAI(base_url=base_url, api_key="not-needed", max_retries=0)
+    run_id = uuid.uuid4().hex[:8]  # Keeps earlier runs' prompts out of the server's cache
+    results = {}
+    # Without the shared prefix first, so its prompts can't warm anything for the other layout
+    for shared_prefix in (False, True):
+        prompts, messages = book_prompts(shared_prefix, args.prompts, args.bible_words, run_id)
+        times = first_token_times(client, args.model, messages)
+        stats = prompts.stats()
+        results[shared_prefix] = statistics.median(times)
+        label = "shared prefix" if shared_prefix else "per-call first"
+        print(f"{label:<16} median ttft {statistics.median(times):.3f}s  total {sum(times):.2f}s  "
+              f"reusable prefix {stats['shared_prefix_tokens']} tokens ({stats['reusable_share']:.0%} of prompt tokens)")
+    if results[True] > 0:
+        print(f"First token {results[False] / results[True]:.1f}x sooner with the shared prefix.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help="a real OpenAI-compatible server; the mock server is used if left out")
+    parser.add_argument('--model', default="local-model")
+    parser.add_argument('--prompts', type=int, default=12, help="prompts sent per layout")
+    parser.add_argument('--bible-words', type=int, default=400, help="length of the premise in the book bible")
+    parser.add_argument('--prefill-tokens-per-sec', type=float, default=2000.0, help="mock server prompt processing speed")
+    args = parser.parse_args(argv)
+
+    if args.base_url:
+        run(args.base_url, args)
+        return
+
+    from mock_server import MockOpenAIServer
+    with MockOpenAIServer(latency=0.0, prefill_tokens_per_sec=args.prefill_tokens_per_sec) as mock:
+        run(mock.base_url, args)
+        stats = mock.stats()
+        print(f"Mock server: {stats['prefill_tokens']} prompt tokens processed, {stats['cached_prompt_tokens']} served from its prefix cache.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Fuzz and scaling check for the chapter splitter.
+
+    python benchmarks/bench_splitter.py            # 1, 2, 4 and 8 MB inputs
+    python benchmarks/bench_splitter.py --sizes 1 16 --fuzz 500
+
+Builds narrative-like inputs with every heading style the splitter knows (plus near
+misses that must not count as headings), checks the records it returns, and times it
+at growing sizes. The time per MB should stay roughly flat; the run fails when the
+largest input costs more than --max-ratio times the smallest per MB.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from chapter_splitter import split_chapters
+
+ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII"]
+HEADINGS = [
+    "Chapter {n}: {title}",
+    "## Chapter {n} - {title}",
+    "- **Chapter {roman}** – {title}",
+    "**Chapter {n}: {title}** - Rising action",
+    "{n}. Chapter {n}: {title}",
+    "Ch. {n}. {title}",
+    "CHAPTER {n}",
+]
+# Only headings when a text has no "Chapter" headings; otherwise they sit inside a chapter
+PART_HEADINGS = [
+    "### Part {n}",
+    "* Section {n} — {title}",
+]
+NEAR_MISSES = [
+    "- Part {n}: the storm breaks",
+    "### Section {m}",
+    "Chapter mix. A word that only looks like a numeral.",
+    "Chapter {n} ends with the storm breaking over the harbor.",
+    "In chapter {n}: nothing, because this line doesn't start with it.",
+    "The chapters {n} and {m} were never written.",
+    "#" * 40,
+    "- " * 60 + "Chapter",
+    "**" * 50,
+    ":" * 80,
+]
+WORDS = "the keeper walked along the harbor wall while storm clouds gathered and the tide came in".split()
+
+
+def make_input(target_bytes, rng, headings=HEADINGS):
+    """Returns (text, the chapter numbers its headings carry) of roughly 'target_bytes'."""
+    parts = ["Some preamble the model wrote before the first chapter.\n\n"]
+    size = len(parts[0])
+    chapters = 0
+    numbers = []
+    while size < target_bytes:
+        chapters += 1
+        heading = rng.choice(headings)
+        if "{roman}" in heading and chapters > len(ROMAN):
+            heading = heading.replace("{roman}", "{n}")
+        heading = heading.format(n=chapters, roman=ROMAN[(chapters - 1) % len(ROMAN)], title="The Storm")
+        numbers.append(chapters)
+        body = []
+        for _ in range(rng.randint(5, 40)):
+            if rng.random() < 0.1 and headings is HEADINGS:
+                body.append(rng.choice(NEAR_MISSES).format(n=rng.randint(1, 99), m=rng.randint(1, 99)))
+            else:
+                body.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 60))))
+        block = heading + "\n" + "\n\n".join(body) + "\n\n"
+        parts.append(block)
+        size += len(block)
+    return "".join(parts), numbers
+
+
+def check(text, numbers):
+    records = split_chapters(text)
+    assert len(records) == len(numbers), f"expected {len(numbers)} chapters, found {len(records)}"
+    assert [record.number for record in records] == numbers, "chapter numbers don't match their headings"
+    previous_end = records[0].start if records else 0
+    for record in records:
+        assert record.start == previous_end, "chapters must tile the text without gaps"
+        assert record.start < record.body_start <= record.end <= len(text)
+        previous_end = record.end
+    assert not records or records[-1].end == len(text)
+    return records
+
+
+def fuzz(rounds, rng):
+    """Random garbage must never crash the splitter or produce inconsistent offsets."""
+    alphabet = "Chapter chapter Ch. Part Section IVXLM 0123456789 #*-_:.)–—\t\n abc"
+    for _ in range(rounds):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 3000)))
+        records = split_chapters(text)
+        for record in records:
+            assert 0 <= record.start < record.body_start <= record.end <= len(text)
+        for before, after in zip(records, records[1:]):
+            assert before.end == after.start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 2, 4, 8], help="input sizes in MB")
+    parser.add_argument('--fuzz', type=int, default=200, help="rounds of random-input fuzzing")
+    parser.add_argument('--max-ratio', type=float, default=2.0, help="allowed growth of seconds per MB, largest vs smallest")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    fuzz(args.fuzz, rng)
+    print(f"Fuzzed {args.fuzz} random inputs: ok")
+    check(*make_input(64 * 1024, rng, headings=PART_HEADINGS))
+    print("Part/Section headings without chapters: ok")
+
+    per_mb = []
+    for size in args.sizes:
+        text, numbers = make_input(int(size * 1024 * 1024), rng)
+        elapsed = float('inf')
+        for _ in range(3):  # Best of three keeps timer noise out of the ratio
+            started = time.perf_counter()
+            check(text, numbers)
+            elapsed = min(elapsed, time.perf_counter() - started)
+        per_mb.append(elapsed / size)
+        print(f"{size:>6.1f} MB  {len(numbers):>6} chapters  {elapsed:.3f}s  ({elapsed / size:.3f}s per MB)")
+
+    ratio = per_mb[-1] / per_mb[0] if per_mb and per_mb[0] > 0 else 1.0
+    print(f"Largest vs smallest, seconds per MB: {ratio:.2f}x")
+    if ratio > args.max_ratio:
+        raise SystemExit(f"Splitting no longer scales linearly ({ratio:.2f}x > {args.max_ratio}x).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = (
+    "the lantern keeper walked along the harbor wall while storm clouds gathered over "
+    "Mira and Tobin who argued about the map the old captain left behind a secret door "
+    "opened beneath the lighthouse and the tide came in faster than anyone expected"
+).split()
+
+
+class MockOpenAIServer:
+    """
+    A deterministic stand-in for an OpenAI-compatible /v1/chat/completions server, so the
+    generator can be benchmarked without a GPU or network. Every answer is built from a
+    hash of the request, so the same prompt always gets the same text.
+
+    latency:          seconds before the first token
+    tokens_per_sec:   generation speed once tokens start flowing
+    completion_tokens: words per answer
+    failure_rate:     fraction of requests answered with HTTP 500 (seeded, so repeatable)
+    chapters:         how many "Chapter N:" sections to write when asked about each chapter
+    prefill_tokens_per_sec: if set, prompt processing costs time too, except for the part of
+                      the prompt that starts like one of the last few prompts (a prefix cache,
+                      like llama.cpp's or vLLM's)
+    supports_n:       answer n choices per request; off, it behaves like servers that ignore n
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, tokens_per_sec=1000.0, completion_tokens=100,
+                 failure_rate=0.0, chapters=5, seed=0, prefill_tokens_per_sec=None, prefix_slots=4, supports_n=True):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.failure_rate = failure_rate
+        self.chapters = chapters
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self.prefix_slots = prefix_slots
+        self.supports_n = supports_n
+        self._recent_prompts = []
+        self.prefill_tokens = 0
+        self.cached_prompt_tokens = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.prompt_bytes = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "prompt_bytes": self.prompt_bytes,
+                "max_in_flight": self.max_in_flight,
+                "prefill_tokens": self.prefill_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+            }
+
+    def prefill_seconds(self, body):
+        """Time to process the prompt, counting ~4 characters a token and skipping the cached prefix."""
+        if not self.prefill_tokens_per_sec:
+            return 0.0
+        # Roughly what a chat template turns the messages into
+        prompt = "".join(f"<|{m.get('role')}|>{m.get('content') or ''}" for m in body.get("messages", []))
+        with self._lock:
+            cached = max((len(os.path.commonprefix([prompt, seen])) for seen in self._recent_prompts), default=0)
+            self._recent_prompts = ([prompt] + self._recent_prompts)[:self.prefix_slots]
+            new_tokens = (len(prompt) - cached) // 4
+            self.prefill_tokens += new_tokens
+            self.cached_prompt_tokens += cached // 4
+        return new_tokens / self.prefill_tokens_per_sec
+
+    def answer(self, body, choice=0):
+        """The text this server replies with for a request body (each of n choices differs)."""
+        digest = hashlib.sha256((json.dumps(body.get("messages"), sort_keys=True) + f"#{choice}").encode('utf-8')).digest()
+        words = random.Random(digest)
+        prose = " ".join(words.choice(WORDS) for _ in range(self.completion_tokens))
+        asked_for_chapters = any("each chapter" in (m.get("content") or "").lower() for m in body.get("messages", []))
+        if asked_for_chapters:
+            per_chapter = max(self.completion_tokens // max(self.chapters, 1), 5)
+            prose_words = prose.split()
+            sections = []
+            for number in range(1, self.chapters + 1):
+                start = ((number - 1) * per_chapter) % max(len(prose_words), 1)
+                sections.append(f"Chapter {number}: " + " ".join(prose_words[start:start + per_chapter]) + ".")
+            return "\n\n".join(sections)
+        return "Title: " + prose.capitalize() + "."
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server._lock:
+                    server.requests += 1
+                    server.prompt_bytes += len(raw)
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    fail = server._random.random() < server.failure_rate
+                    if fail:
+                        server.failures += 1
+                try:
+                    if not self.path.endswith("/chat/completions"):
+                        self._send_json(404, {"error": {"message": "not found"}})
+                        return
+                    time.sleep(server.latency)
+                    if fail:
+                        self._send_json(500, {"error": {"message": "injected failure"}})
+                        return
+                    body = json.loads(raw)
+                    time.sleep(server.prefill_seconds(body))
+                    answers = []
+                    n = max(int(body.get("n") or 1), 1) if server.supports_n and not body.get("stream") else 1
+                    for choice in range(n):
+                        text, finish_reason = server.answer(body, choice), "stop"
+                        # Like a real server, stop at max_tokens and say so
+                        limit = body.get("max_tokens")
+                        if limit and len(text.split(" ")) > limit:
+                            text, finish_reason = " ".join(text.split(" ")[:limit]), "length"
+                        answers.append((text, finish_reason))
+                    if body.get("stream"):
+                        self._stream(body, *answers[0])
+                    else:
+                        self._complete(body, answers)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # The client stopped reading, e.g. after the first token
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _complete(self, body, answers):
+                lengths = [len(text.split(" ")) for text, _ in answers]
+                # Choices are generated side by side, so the longest one sets the pace
+                time.sleep(max(lengths) / server.tokens_per_sec)
+                self._send_json(200, {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [
+                        {"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}
+                        for i, (text, finish_reason) in enumerate(answers)
+                    ],
+                    "usage": self._usage(body, sum(lengths)),
+                })
+
+            def _usage(self, body, completion_tokens):
+                return {
+                    "prompt_tokens": sum(len((m.get("content") or "").split()) for m in body.get("messages", [])),
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": 0,
+                }
+
+            def _stream(self, body, text, finish_reason="stop"):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                tokens = text.split(" ")
+                delay = 1.0 / server.tokens_per_sec
+                for index, token in enumerate(tokens):
+                    piece = token if index == 0 else " " + token
+                    self._event({"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+                    time.sleep(delay)
+                self._event({"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    # Like the OpenAI API: one last chunk with no choices, just the usage
+                    self._event({"choices": [], "usage": self._usage(body, len(tokens))})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _event(self, payload):
+                payload.update({"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": "mock"})
+                self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock OpenAI-compatible server on its own.")
+    parser.add_argument('--port', type=int, default=1234)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--tokens-per-sec', type=float, default=1000.0)
+    parser.add_argument('--completion-tokens', type=int, default=100)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--chapters', type=int, default=5)
+    parser.add_argument('--prefill-tokens-per-sec', type=float, default=None)
+    args = parser.parse_args()
+    mock = MockOpenAIServer(port=args.port, latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                            completion_tokens=args.completion_tokens, failure_rate=args.failure_rate,
+                            chapters=args.chapters, prefill_tokens_per_sec=args.prefill_tokens_per_sec)
+    print(f"Mock server listening on {mock.base_url}")
+    mock._server.serve_forever()
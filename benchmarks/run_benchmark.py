@@ -0,0 +1,192 @@
+"""
+Offline benchmark: drives StoryGenerator end to end in auto mode against the mock server
+for books of several sizes, and compares the numbers with a stored baseline.
+
+    python benchmarks/run_benchmark.py                      # 5, 20 and 100 chapters
+    python benchmarks/run_benchmark.py --sizes 5 20 --stream
+    python benchmarks/run_benchmark.py --save-baseline      # store this run as the new baseline
+
+Each book size runs in its own process so peak memory is measured per book.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+try:
+    import resource  # Not available on Windows; peak RSS is reported as None there
+except ImportError:
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+# Lower is better for all of these; they are the ones compared against the baseline
+COMPARED = ("wall_seconds", "requests", "prompt_bytes", "peak_rss_mb")
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def run_single(args):
+    """Generates one book against a fresh mock server and prints its metrics as JSON."""
+    from book_generator import StoryGenerator
+    from mock_server import MockOpenAIServer
+
+    workdir = tempfile.mkdtemp(prefix='storysmith-bench-')
+    os.chdir(workdir)
+    mock = MockOpenAIServer(latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                            completion_tokens=args.completion_tokens, failure_rate=args.failure_rate,
+                            chapters=args.single)
+    with mock:
+        def make_generator():
+            generator = StoryGenerator(base_url=mock.base_url, max_concurrency=args.concurrency, stream=args.stream,
+                                       cache_path=os.path.join(workdir, 'cache.sqlite'), retry_backoff=0.05)
+            generator.open_project(f"bench_{args.single}")
+            return generator
+
+        generator = make_generator()
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            generator.run_auto_pipeline("A lighthouse keeper finds a map", "mysterious", args.single, show_progress=False)
+        wall = time.perf_counter() - started
+        server = mock.stats()
+        cache = generator.cache.stats()
+
+        result = {
+            "chapters": args.single,
+            "wall_seconds": round(wall, 3),
+            "requests": server["requests"],
+            "failures": server["failures"],
+            "max_concurrency": server["max_in_flight"],
+            "prompt_bytes": server["prompt_bytes"],
+            "cache_hit_rate": round(cache["hit_rate"], 3),
+        }
+
+        if args.warm:
+            # Same book again on the same cache: what a re-run or resume costs
+            warm_generator = make_generator()
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                warm_generator.run_auto_pipeline("A lighthouse keeper finds a map", "mysterious", args.single, show_progress=False)
+            result["warm_wall_seconds"] = round(time.perf_counter() - started, 3)
+            result["warm_cache_hit_rate"] = round(warm_generator.cache.stats()["hit_rate"], 3)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+def run_sizes(args):
+    results = []
+    for size in args.sizes:
+        command = [sys.executable, os.path.abspath(__file__), '--single', str(size),
+                   '--concurrency', str(args.concurrency), '--latency', str(args.latency),
+                   '--tokens-per-sec', str(args.tokens_per_sec), '--completion-tokens', str(args.completion_tokens),
+                   '--failure-rate', str(args.failure_rate)]
+        if args.stream:
+            command.append('--stream')
+        if args.warm:
+            command.append('--warm')
+        print(f"Benchmarking a {size}-chapter book...", flush=True)
+        finished = subprocess.run(command, capture_output=True, text=True)
+        if finished.returncode != 0:
+            print(finished.stderr)
+            raise SystemExit(f"The {size}-chapter run failed.")
+        results.append(json.loads(finished.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def settings_of(args):
+    return {
+        "concurrency": args.concurrency,
+        "latency": args.latency,
+        "tokens_per_sec": args.tokens_per_sec,
+        "completion_tokens": args.completion_tokens,
+        "failure_rate": args.failure_rate,
+        "stream": args.stream,
+    }
+
+
+def report(results, baseline, tolerance):
+    """Prints a table of the results and returns the metrics that regressed past 'tolerance'."""
+    columns = ["chapters", "wall_seconds", "requests", "max_concurrency", "prompt_bytes", "cache_hit_rate", "peak_rss_mb"]
+    if any("warm_wall_seconds" in result for result in results):
+        columns += ["warm_wall_seconds", "warm_cache_hit_rate"]
+    print("\n" + "  ".join(f"{column:>16}" for column in columns))
+
+    previous = {entry["chapters"]: entry for entry in (baseline or {}).get("results", [])}
+    regressions = []
+    for result in results:
+        print("  ".join(f"{str(result.get(column)):>16}" for column in columns))
+        before = previous.get(result["chapters"])
+        if not before:
+            continue
+        changes = []
+        for metric in COMPARED:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            changes.append(f"{metric} {change:+.0%}")
+            if change > tolerance:
+                regressions.append(f"{result['chapters']} chapters: {metric} {old} -> {new} ({change:+.0%})")
+        print(f"{'':>16}  vs baseline: " + ", ".join(changes))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the book pipeline against a local mock server.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 20, 100], help="book sizes (chapters) to run")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help="mock seconds before the first token")
+    parser.add_argument('--tokens-per-sec', type=float, default=1000.0)
+    parser.add_argument('--completion-tokens', type=int, default=100)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--warm', action='store_true', help="also time a second run on the warm response cache")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help="exit non-zero when a metric is this much worse than baseline")
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.single:
+        run_single(args)
+        return
+
+    results = run_sizes(args)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings_of(args):
+            print("Note: the baseline was recorded with different settings, so the comparison is rough.")
+
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({"settings": settings_of(args), "results": results}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print("\nSlower than the baseline:\n  " + "\n  ".join(regressions))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
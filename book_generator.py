@@ -1,39 +1,320 @@
 import re
 import os
-from openai import OpenAI  
+import time
+import json
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from task_graph import TaskGraph
+from response_cache import ResponseCache
+from endpoint_pool import EndpointPool
+from story_memory import StoryMemory, count_tokens, fit_texts, truncate_to_tokens
+from run_manifest import RunManifest
+from telemetry import Telemetry
+import exporters
+from chapter_splitter import split_chapters
+from prompts import PromptBook
+from candidates import rank_candidates
+
+
+class GenerationError(Exception):
+    """Raised when a step still has no output after every retry."""
+
+
+class Completion:
+    """The text one LLM call produced, plus the numbers the run manifest keeps about it."""
+    def __init__(self, content, latency=0.0, prompt_tokens=None, completion_tokens=None, attempts=1, cached=False,
+                 first_token=None, endpoint=None, finish_reason=None, choices=None, queue_wait=0.0):
+        self.content = content
+        self.latency = latency
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.attempts = attempts
+        self.cached = cached
+        self.first_token = first_token
+        self.endpoint = endpoint
+        self.finish_reason = finish_reason
+        # Seconds spent waiting for a free slot in the endpoint pool; not part of 'latency'
+        self.queue_wait = queue_wait
+        # Every candidate answer when several were asked for (content is the first of them)
+        self.choices = choices if choices is not None else [content]
+
 
 class StoryGenerator:
-    def __init__(self, base_url="http://localhost:1234/v1", api_key="not-needed", temperature=0.7):
-        self.client = OpenAI(base_url=base_url, api_key=api_key)
+    def __init__(self, base_url="http://localhost:1234/v1", api_key="not-needed", temperature=0.7,
+                 max_concurrency=4, max_retries=2,
+                 cache_path=os.path.join('generated_content', 'llm_cache.sqlite'), cache_max_bytes=256 * 1024 * 1024,
+                 stream=False, endpoints=None, routing="least_outstanding", pool=None, cache=None,
+                 context_budget=3000, resume=False, retry_backoff=2.0, prometheus_path=None,
+                 export_formats=("txt",), toc_from_headers=False,
+                 scene_mode=False, beats_per_scene=3, scene_words=600, scene_max_tokens=1024, max_continuations=2,
+                 shared_prefix=True, candidates=1, candidate_steps=("premise", "title", "toc", "chapter")):
         self.temperature = temperature
+        # How many chapter requests may be in flight at once (1 = the old one-by-one behaviour)
+        self.max_concurrency = max(1, max_concurrency)
+        # Several servers can share the work: a list of URLs or {"base_url", "max_in_flight", "api_key"} dicts.
+        # Batch runs pass in one ready-made pool (and cache) shared by every book.
+        self.pool = pool or EndpointPool.from_specs(endpoints or [base_url], default_api_key=api_key,
+                                                    default_max_in_flight=self.max_concurrency, strategy=routing)
+        self.client = self.pool.endpoints[0].client
+        # Keep enough workers around to fill every server's slots
+        self.max_concurrency = max(self.max_concurrency, self.pool.capacity)
+        # How many extra attempts a failed call gets, waiting retry_backoff, 2x, 4x... seconds in between
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # Resume: skip steps the run manifest says are done with an unchanged prompt
+        self.resume = resume
+        # Responses are cached on (messages, model, temperature, max_tokens); pass cache_path=None to turn it off
+        if cache is None and cache_path:
+            cache = ResponseCache(cache_path, cache_max_bytes)
+        self.cache = cache
+        # Stream tokens straight into '<file>.partial' instead of waiting for the whole completion
+        self.stream = stream
+        # Which books compile_book writes (txt, md, html, epub) and whether the TOC comes from chapter headings
+        self.export_formats = tuple(export_formats)
+        self.toc_from_headers = toc_from_headers
+        # Scene mode writes each chapter as several bounded requests instead of one long one
+        self.scene_mode = scene_mode
+        self.beats_per_scene = max(1, beats_per_scene)
+        self.scene_words = scene_words
+        self.scene_max_tokens = scene_max_tokens
+        self.max_continuations = max_continuations
+        # Best-of-N: these steps ask for several answers at once and keep the one that scores
+        # best on cheap local checks; the runners-up are kept for manual mode's "next"
+        self.candidates = max(1, candidates)
+        self.candidate_steps = set(candidate_steps)
+        self._alternatives = {}
+        # Every prompt is rendered from the templates in prompts.py, opening with the same
+        # instructions + book bible so the server can reuse its KV cache between calls
+        self.prompts = PromptBook(shared_prefix=shared_prefix)
+        # Tokens of story context (earlier outlines, chapter notes...) one prompt may carry, so
+        # prompts stay inside a small model's window however long the book gets
+        self.context_budget = context_budget
         # Initialize base_dir later when book_title is known
         self.base_dir = None
+        self._story_memory = None
+        self._manifest = None
+        # Every LLM call lands here; open_project points the JSONL trace at the book's folder
+        self.telemetry = Telemetry(prometheus_path=prometheus_path)
+        self._project_lock = threading.Lock()
 
     def setup_project(self):
         book_title = input("First things first, what's the title of your Folder name masterpiece? ")
-        self.base_dir = os.path.join('generated_content', self.sanitize_filename(book_title))
-        os.makedirs(self.base_dir, exist_ok=True)
+        self.open_project(book_title)
         self.main()
 
-    def sanitize_filename(self, filename):
+    def open_project(self, book_title):
+        self.base_dir = os.path.join('generated_content', self.sanitize_filename(book_title))
+        os.makedirs(self.base_dir, exist_ok=True)
+        self.telemetry.open_trace(os.path.join(self.base_dir, 'telemetry.jsonl'))
+
+    @property
+    def story_memory(self):
+        # Lives next to the book's files, so a resumed run remembers earlier chapters
+        with self._project_lock:
+            if self._story_memory is None:
+                self._story_memory = StoryMemory(os.path.join(self.base_dir, 'story_memory.json'))
+            return self._story_memory
+
+    @property
+    def manifest(self):
+        # A fresh run starts a new manifest; --resume picks up the old one
+        with self._project_lock:
+            if self._manifest is None:
+                self._manifest = RunManifest(os.path.join(self.base_dir, 'manifest.json'), fresh=not self.resume)
+            return self._manifest
+
+    @staticmethod
+    def sanitize_filename(filename):
         """
         Sanitizes filenames to remove or replace invalid characters.
         """
         return re.sub(r'[\\/*?:"<>|]', "", filename)
 
-    def call_openai_api(self, messages, model="local-model"):
+    def call_openai_api(self, messages, model="local-model", max_tokens=None, step="call"):
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=self.temperature,
-            )
-            content = response.choices[0].message.content
-            return content
+            return self.complete(messages, model=model, max_tokens=max_tokens, step=step).content
         except Exception as e:
             print(f"Error calling API: {str(e)}")
             return None
 
+    def complete(self, messages, model="local-model", max_tokens=None, stream_to=None, step="call", n=1,
+                 cache_truncated=True):
+        """
+        Runs one completion through the response cache and the endpoint pool, retrying
+        with exponential backoff. Returns a Completion, or raises the last error once
+        every attempt has failed. With 'stream_to' the text is streamed into that file.
+        With n > 1, n candidate answers come back in Completion.choices (not streamed).
+        cache_truncated=False leaves answers cut off at max_tokens out of the cache, for
+        callers that continue them and cache the whole text themselves.
+        Every call is recorded in the telemetry under 'step'.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResponseCache.make_key(messages, model, self.temperature, max_tokens, n=n)
+            content = self.cache.get(cache_key)
+            if content is not None:
+                choices = json.loads(content) if n > 1 else [content]
+                if stream_to:
+                    self.save_to_file(stream_to, choices[0])
+                self.telemetry.record(step, latency=0.0, cache="hit")
+                return Completion(choices[0], cached=True, finish_reason="stop", choices=choices)
+
+        attempts = self.max_retries + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                if stream_to:
+                    completion = self._stream_once(messages, stream_to, model, max_tokens)
+                else:
+                    completion = self._request_once(messages, model, max_tokens, n=n)
+                if completion.content is None:
+                    raise ValueError("the server returned an empty message")
+                break
+            except Exception as e:
+                if attempt == attempts:
+                    self.telemetry.record(step, cache="miss" if cache_key else "off", attempts=attempt, ok=False, error=e)
+                    raise
+                delay = min(self.retry_backoff * 2 ** (attempt - 1), 60) * random.uniform(0.5, 1.5)
+                print(f"Attempt {attempt} failed ({str(e)}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+        completion.attempts = attempt
+        if cache_key is not None and (cache_truncated or completion.finish_reason != "length"):
+            self.cache.put(cache_key, json.dumps(completion.choices) if n > 1 else completion.content)
+        self.telemetry.record(step, latency=completion.latency, prompt_tokens=completion.prompt_tokens,
+                              completion_tokens=completion.completion_tokens, first_token=completion.first_token,
+                              endpoint=completion.endpoint, cache="miss" if cache_key else "off", attempts=attempt,
+                              queue_wait=completion.queue_wait)
+        return completion
+
+    def complete_with_continuation(self, messages, max_tokens, continuations, step="call"):
+        """
+        Runs a bounded completion and, whenever the model stops because it hit max_tokens
+        (finish_reason == "length"), asks it to carry on, up to 'continuations' times.
+        Returns one Completion with the pieces joined and the numbers summed up. The
+        joined text is cached under the first request's key, so a re-run replays it in one hit.
+        """
+        completion = self.complete(messages, max_tokens=max_tokens, step=step, cache_truncated=False)
+        pieces = [completion.content]
+        rounds = 0
+        while completion.finish_reason == "length" and rounds < continuations:
+            rounds += 1
+            follow_up = messages + [
+                {"role": "assistant", "content": "".join(pieces)},
+                {"role": "user", "content": "Continue the text exactly where it stops. Do not repeat anything that is already written."}
+            ]
+            more = self.complete(follow_up, max_tokens=max_tokens, step=step, cache_truncated=False)
+            pieces.append(more.content)
+            completion.latency += more.latency
+            completion.queue_wait += more.queue_wait
+            completion.attempts += more.attempts
+            if more.completion_tokens is not None:
+                completion.completion_tokens = (completion.completion_tokens or 0) + more.completion_tokens
+            completion.finish_reason = more.finish_reason
+        completion.content = "".join(pieces)
+        if completion.finish_reason == "length":
+            print(f"Warning: {step} still hit max_tokens ({max_tokens}) after {rounds} continuation(s); keeping it cut off.")
+        if rounds and self.cache is not None:
+            self.cache.put(ResponseCache.make_key(messages, "local-model", self.temperature, max_tokens), completion.content)
+        return completion
+
+    def _request_once(self, messages, model, max_tokens, n=1):
+        request = {"model": model, "messages": messages, "temperature": self.temperature}
+        if max_tokens is not None:
+            request["max_tokens"] = max_tokens
+        served_by = []
+        sent_at = []
+
+        def send(endpoint, request=request):
+            # Runs once the pool has handed us a slot, so waiting in line isn't counted as latency
+            served_by.append(endpoint.base_url)
+            sent_at.append(time.perf_counter())
+            return endpoint.client.chat.completions.create(**request)
+
+        first_request = dict(request, n=n) if n > 1 else request
+        queued = time.perf_counter()
+        responses = [self.pool.call(lambda endpoint: send(endpoint, first_request))]
+        choices = responses[0].choices[:n]
+        if n > 1 and len(choices) < n:
+            # Plenty of local servers ignore n; make up the rest with requests side by side
+            with ThreadPoolExecutor(max_workers=n - len(choices)) as executor:
+                responses += list(executor.map(lambda _: self.pool.call(send), range(n - len(choices))))
+            choices += [choice for response in responses[1:] for choice in response.choices[:1]]
+        usages = [getattr(response, 'usage', None) for response in responses]
+        return Completion(
+            choices[0].message.content if choices else None,
+            latency=time.perf_counter() - sent_at[0],
+            queue_wait=sent_at[0] - queued,
+            prompt_tokens=getattr(usages[0], 'prompt_tokens', None),
+            completion_tokens=sum(getattr(usage, 'completion_tokens', None) or 0 for usage in usages) or None,
+            endpoint=served_by[-1],
+            finish_reason=choices[0].finish_reason if choices else None,
+            choices=[choice.message.content for choice in choices],
+        )
+
+    def _stream_once(self, messages, filename, model, max_tokens):
+        filepath = os.path.join(self.base_dir, filename)
+        partial_path = filepath + '.partial'
+        pieces = []
+        request_messages = messages
+        if os.path.exists(partial_path):
+            with open(partial_path, 'r', encoding='utf-8') as f:
+                already_written = f.read()
+            if already_written.strip():
+                print(f"Picking up {filename} where the last run stopped ({len(already_written)} characters kept).")
+                pieces.append(already_written)
+                request_messages = messages + [
+                    {"role": "assistant", "content": already_written},
+                    {"role": "user", "content": "Continue the text exactly where it stops. Do not repeat anything that is already written."}
+                ]
+
+        # Without include_usage a streamed answer carries no token counts at all
+        request = {"model": model, "messages": request_messages, "temperature": self.temperature, "stream": True,
+                   "stream_options": {"include_usage": True}}
+        if max_tokens is not None:
+            request["max_tokens"] = max_tokens
+
+        queued = time.perf_counter()
+        first_token_at = None
+        token_count = 0
+        usage = None
+        finish_reason = None
+        with open(partial_path, 'a', encoding='utf-8') as partial, self.pool.lease() as endpoint:
+            started = time.perf_counter()  # Timed from when the slot is ours, not from when we queued for it
+            for chunk in endpoint.client.chat.completions.create(**request):
+                usage = getattr(chunk, 'usage', None) or usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                token_count += 1  # Servers send roughly one token per chunk
+                partial.write(delta)
+                partial.flush()
+                pieces.append(delta)
+
+        os.replace(partial_path, filepath)
+        finished = time.perf_counter()
+        if first_token_at is not None:
+            generating = finished - first_token_at
+            rate = token_count / generating if generating > 0 else float('inf')
+            print(f"  {filename}: first token after {first_token_at - started:.2f}s, {token_count} tokens at {rate:.1f} tok/s")
+
+        return Completion(
+            "".join(pieces),
+            latency=finished - started,
+            prompt_tokens=getattr(usage, 'prompt_tokens', None),
+            completion_tokens=getattr(usage, 'completion_tokens', None) or token_count,
+            first_token=first_token_at - started if first_token_at is not None else None,
+            endpoint=endpoint.base_url,
+            finish_reason=finish_reason,
+            queue_wait=started - queued,
+        )
+
     def save_to_file(self, filename, content):
         # This method saves 'content' to a file named 'filename' in the specified base directory
         filepath = os.path.join(self.base_dir, filename)  # Use self.base_dir to construct the filepath
@@ -48,218 +329,278 @@ class StoryGenerator:
                 return f.read().strip()
         return None
 
-    def generate_content(self, prompt, filename):
-        content = self.load_from_file(filename)
-        if content is None:  # If content doesn't exist, proceed to generate
-            content = self.call_openai_api(prompt)
+    def load_previous_output(self, filename):
+        # With a response cache the prompt itself decides what is still fresh, so an old
+        # file is only trusted blindly when there is no cache to ask
+        if self.cache is not None:
+            return None
+        return self.load_from_file(filename)
+
+    def step_name(self, filename):
+        # 'chapter_07.txt' and 'outline_chapter_7.txt' are reported as 'chapter' and 'outline_chapter'
+        return re.sub(r'_?\d+', '', os.path.splitext(filename)[0])
+
+    def produce_content(self, prompt, filename, max_tokens=None, continuations=0, expect=None):
+        """
+        Runs one step and records it in the run manifest. Returns (content, already_saved):
+        streamed and reused outputs are already on disk, anything else still needs saving.
+        Raises GenerationError when every attempt failed, instead of handing on None.
+        With 'continuations' the step is a bounded request that is continued when it hits
+        max_tokens (these are never streamed). Steps in candidate_steps get self.candidates
+        answers, ranked by rank_candidates with 'expect' (e.g. num_chapters for the TOC).
+        """
+        step = self.step_name(filename)
+        n = self.candidates if step in self.candidate_steps and not continuations else 1
+        stream = self.stream and not continuations and n == 1
+        input_hash = RunManifest.hash_input(prompt)
+        if self.resume and self.manifest.is_fresh(filename, input_hash):
+            content = self.load_from_file(filename)
+            if content is not None:
+                return content, True
+
+        # On --resume a file made from a different prompt is out of date, whatever is on disk
+        stale = self.resume and self.manifest.changed(filename, input_hash)
+        content = None if stale else self.load_previous_output(filename)
+        if content is not None:  # If content exists, there's nothing to generate
+            # Which prompt made the file is unknown, so it isn't recorded under this one
+            self.manifest.start(filename, None, filename)
+            self.manifest.finish(filename, attempts=0, cached=True)
+            return content, True
+
+        self.manifest.start(filename, input_hash, filename)
+        try:
+            if continuations:
+                completion = self.complete_with_continuation(prompt, max_tokens, continuations, step=step)
+            else:
+                completion = self.complete(prompt, max_tokens=max_tokens, stream_to=filename if stream else None, step=step, n=n)
+        except Exception as e:
+            self.manifest.fail(filename, e, attempts=self.max_retries + 1)
+            raise GenerationError(f"Could not generate {filename}: {str(e)}") from e
+        self.manifest.finish(filename, attempts=completion.attempts, latency=round(completion.latency, 3),
+                             prompt_tokens=completion.prompt_tokens, completion_tokens=completion.completion_tokens,
+                             cached=completion.cached)
+        if n > 1:
+            ranked = rank_candidates(step, completion.choices, **(expect or {}))
+            if not ranked:
+                raise GenerationError(f"Could not generate {filename}: every candidate came back empty")
+            completion.content = ranked[0]
+            self._alternatives[filename] = ranked[1:]
+        return completion.content, stream
+
+    def generate_content(self, prompt, filename, **expect):
+        content, already_saved = self.produce_content(prompt, filename, expect=expect)
+        if not already_saved:
             self.save_to_file(filename, content)
         return content
 
     def generate_premise(self, story_idea, tone):
-        premise_prompt = [
-            {
-                "role": "system",
-                "content": "Create a compelling premise for a story. The premise should include (1) a protagonist described with an adjective and a noun, (2) their primary goal, (3) the central situation or crisis they face, and (4) a unique element or 'special sauce' that sets the story apart. This unique element could be a fresh perspective, a distinctive character voice, or an intriguing take on current events. Ensure the premise is concise yet captures the essence of the story idea and tone."
-            },
-            {
-                "role": "user",
-                "content": f"Generate a premise that includes the required elements to outline the story's foundation, based on the story idea '{story_idea}' and the tone '{tone}'."
-            }
-        ]
-        return self.generate_content(premise_prompt, 'premise.txt')
+        # The story idea and tone go into the book bible that opens every prompt from here on
+        self.prompts.update(story_idea=story_idea, tone=tone)
+        return self.generate_content(self.prompts.messages("premise"), 'premise.txt')
 
     def generate_title(self, premise, story_idea, tone):
-        title_prompt = [
-            {
-                "role": "system",
-                "content": "You are an expert in crafting intriguing titles for stories. Please provide the title in the format: Title: <title_placeholder>. you only output the title."
-            },
-            {
-                "role": "user",
-                "content": f"Write 1 perfect title for the book using the format Title: <title_placeholder>. based on the Given premise:\n\n '{premise}'.\n\n the story idea : \n'{story_idea}'.\ntone: '{tone}'."
-            }
-        ]
-        return self.generate_content(title_prompt, 'title.txt')
+        self.prompts.update(story_idea=story_idea, tone=tone, premise=premise)
+        return self.generate_content(self.prompts.messages("title"), 'title.txt')
 
     def generate_toc(self, premise, story_idea, tone, num_chapters):
-        toc_prompt = [
-            {
-                "role": "system",
-                "content": f"You are tasked with generating a table of contents for {num_chapters} chapters. An excellent table of contents provides clear, concise, and descriptive chapter titles that give readers a glimpse of the chapter's content while invoking curiosity. The titles should be consistent in tone and style, and they should align with the overarching theme of the story."
-            },
-            {
-                "role": "user",
-                "content": f"Please follow the format: Table of Content: Chapter 1: <Title>, Chapter 2: <Title>, ... up to {num_chapters} chapters. Generate this table based on the premise '{premise}', the story idea '{story_idea}', and the tone '{tone}'."
-            }
-        ]
-        return self.generate_content(toc_prompt, 'toc.txt')
+        self.prompts.update(story_idea=story_idea, tone=tone, premise=premise)
+        return self.generate_content(self.prompts.messages("toc", num_chapters=num_chapters), 'toc.txt', num_chapters=num_chapters)
 
     def identify_content_types(self, toc, story_idea, premise, tone):
         # Directly pass the initial ToC as part of the prompt without splitting or altering it
-        content_types_prompt = [
-            {
-                "role": "system",
-                "content": ("You're tasked with enriching an existing table of contents by adding a brief content type description next to each chapter title. Your additions should provide insights into the key events or themes of each chapter without changing the original titles. Use the format: [Original Chapter Title] - [Content Type]. Focus on incorporating content types that reflect significant plot events, character development, and thematic elements, ensuring they align with the story's tone of '" + tone + "'. Be concise and avoid modifying the chapter titles.")
-            },
-            {
-                "role": "user",
-                "content": f"Below is the table of contents for a story based on the idea '{story_idea}', with a premise '{premise}', and a desired tone of '{tone}'. For each chapter, add a content type description next to the original title using the specified format. Ensure your additions enhance understanding of the chapter's focus without altering the titles.\n\n{toc}"
-            }
-        ]
-        
-        return self.generate_content(content_types_prompt, 'content_types.txt')
-
+        self.prompts.update(story_idea=story_idea, tone=tone, premise=premise)
+        return self.generate_content(self.prompts.messages("content_types", toc=toc), 'content_types.txt')
 
     def refine_content_types(self, content_types, premise, tone):
-        refine_prompt = [
-            {
-                "role": "system",
-                "content": ("Refine the initial content types to ensure a coherent narrative and depth. Focus on a logical sequence of events, natural character development, seamless integration of background information, and avoidance of unnecessary details. Maintain consistency with the tone: '" + tone + "'. Use bullet points or succinct phrases for clarity.")
-            },
-            {
-                "role": "user",
-                "content": "Given the initial content types:\n\n" + content_types + "\n\nand the premise '" + premise + "', refine and deepen the details for each chapter, using bullet points or succinct phrases. Adhere to the instructions."
-            }
-        ]
-        return self.generate_content(refine_prompt, 'refined_content_types.txt')
+        self.prompts.update(tone=tone, premise=premise)
+        return self.generate_content(self.prompts.messages("refined_content_types", content_types=content_types),
+                                     'refined_content_types.txt')
 
     def deepen_narrative(self, refined_content_types, premise, tone):
-        deepen_prompt = [
-            {
-                "role": "system",
-                "content": ("Elevate the narrative by enriching the refined content types. Focus on expanding crucial plot points, introducing nuanced character dynamics, building tension and conflicts, and smoothly leading towards the climax and resolution. Ensure the details added are pertinent and impactful, and keep everything aligned with the tone: '" + tone + "'. Depth should add to the story's richness without becoming verbose. Maintain the format provided and enhance each chapter's narrative comprehensively.")
-            },
-            {
-                "role": "user",
-                "content": "Expand the narrative for each chapter using the refined content types:\n\n" + refined_content_types + "\n\nConsider the premise '" + premise + "' and the tone '" + tone + "' as you develop the story further. Add depth and detail to each chapter, following the guidelines above."
-            }
-        ]
-        return self.generate_content(deepen_prompt, 'deepened_narrative.txt')
+        self.prompts.update(tone=tone, premise=premise)
+        return self.generate_content(self.prompts.messages("deepened_narrative", refined_content_types=refined_content_types),
+                                     'deepened_narrative.txt')
 
     def extract_chapters_regex(self):
+        """
+        Splits deepened_narrative.txt into extracted_chapter_N.txt files, one per chapter
+        heading, and returns the ChapterRecords found (None if there were none).
+        """
         # construct the filepath to include the base directory
         filepath = os.path.join(self.base_dir, "deepened_narrative.txt")
 
         try:
-            with open(filepath, "r") as file:
+            with open(filepath, "r", encoding='utf-8') as file:
                 content = file.read()
         except FileNotFoundError:
             print(f"File not found: {filepath}. Please check the file path.")
             return None
 
-        # Define patterns in a sequence
-        patterns = [
-            # First pattern for more formal chapter headings
-            r"[.-]?\s*(?:Chapter|Ch\.|Section|Part)\s+\d+:\s*.*?(?=(?:[.-]?\s*(?:Chapter|Ch\.|Section|Part)\s+\d+:|$))",
-            # Second pattern for less formal chapter introductions
-            r"\- Chapter\s+\d+:\s*.*?(?=\s*\- Chapter\s+\d+:|$)"
-        ]
+        # One pass over the lines; handles Markdown headings, lists, roman numerals and "Chapter N –" variants
+        chapters = split_chapters(content)
 
-        chapters = []
-        for pattern in patterns:
-            # Attempt to find matches with the current pattern
-            matches = re.findall(pattern, content, re.DOTALL | re.IGNORECASE)
-            if matches:
-                # If matches are found with the current pattern, extend the chapters list
-                chapters.extend(matches)
-                break  # Break the loop if chapters are found
-
-        # Check if no chapters were extracted with any of the patterns
+        # Check if no chapters were extracted
         if not chapters:
-            print("No chapters were extracted with the provided patterns. Exiting...")
+            print("No chapter headings were found in the deepened narrative. Exiting...")
             return None
 
-        extracted_chapters = []
-        for index, chapter_content in enumerate(chapters, start=1):
-            filename = f"chapter_{index}.txt"
-            self.save_to_file(filename, chapter_content.strip())  # saves each chapter in the base directory
+        seen = set()
+        for chapter in chapters:
+            if chapter.number in seen:
+                continue  # The model repeated a heading; the first one is the chapter
+            seen.add(chapter.number)
+            filename = f"extracted_chapter_{chapter.number}.txt"  # Kept apart from the prose chapters (chapter_01.txt...)
+            self.save_to_file(filename, chapter.text(content).strip())  # saves each chapter in the base directory
 
-        return extracted_chapters
+        return chapters
 
     def generate_first_outline(self, premise, num_chapters):
+        self.prompts.update(premise=premise)
         # Load any existing content for Chapter 1, if available
-        chapter_content = self.load_from_file("chapter_1.txt")
+        chapter_content = truncate_to_tokens(self.load_from_file("extracted_chapter_1.txt"), self.context_budget)
         
         # prompt for generating a timeline-like outline for Chapter 1
-        outline_prompt = [
-            {
-                "role": "system",
-                "content": "Outline the key events in Chapter 1 using a concise timeline outtline events . Focus on pivotal moments that introduce characters, setting, and the initial conflict. Keep descriptions brief and to the point."
-            },
-            {
-                "role": "user",
-                "content": f"Chapter 1 content:\n\n{chapter_content}\n\nGenerate a concise outtline events that includes:\n\n- Event: Description (1-2 sentences)\n- Character introduction and development\n- Initial conflict introduction\n- Setting introduction\n\nEnsure clarity and brevity in each point."
-            }
-        ]
-
+        outline_prompt = self.prompts.messages("first_outline", chapter_content=chapter_content)
 
         # Generate and save the timeline-like outline for Chapter 1
         outline = self.generate_content(outline_prompt, 'outline_chapter_1.txt')
+        self.story_memory.record_chapter(1, outline)
+        return outline
+
+    def generate_outline(self, chapter_number):
+        i = chapter_number
+        # Everything below shares one token budget instead of growing with the book
+        chapter_content_N, previous_chapter_outline, earlier_story = fit_texts([
+            (self.load_from_file(f"extracted_chapter_{i}.txt"), 0.45),
+            (self.load_from_file(f"outline_chapter_{i - 1}.txt"), 0.3),
+            (self.story_memory.context_for(i - 1, int(self.context_budget * 0.25)), 0.25),
+        ], self.context_budget)
+        
+        # prompt for timeline generation
+        outline_prompt = self.prompts.messages("outline", chapter_number=i, chapter_content=chapter_content_N,
+                                               previous_outline=previous_chapter_outline, earlier_story=earlier_story)
+
+        # Generate and save the timeline-like outline for the current chapter
+        outline = self.generate_content(outline_prompt, f'outline_chapter_{i}.txt')
+        self.story_memory.record_chapter(i, outline)
         return outline
 
     def generate_remaining_outlines(self, num_chapters):
         for i in range(2, num_chapters + 1):
-            chapter_content_N = self.load_from_file(f"chapter_{i}.txt")
-            previous_chapter_outline = self.load_from_file(f"outline_chapter_{i - 1}.txt")
-            
-            # prompt for timeline generation
-            outline_prompt = [
-                {
-                    "role": "system",
-                    "content": f"Create a concise timeline outline story only for for Chapter {i}, detailing how it progresses the story. Highlight new events, character arcs, and conflicts, ensuring no repetition from previous chapters."
-                },
-                {
-                    "role": "user",
-                    "content": f"Given Chapter {i}'s content:\n\n{chapter_content_N}\n\nCraft a focused timeline  outline events  covering:\n\n- Major events with brief descriptions\n- Character developments\n- New conflicts or escalations\n- Integration of themes\n\nReference from previous chapter's outline:\n\n{previous_chapter_outline}\n\nAim for succinctness and specificity."
-                }
-            ]
-
-            # Generate and save the timeline-like outline for the current chapter
-            self.generate_content(outline_prompt, f'outline_chapter_{i}.txt')
+            self.generate_outline(i)
       
+    def chapter_prompt(self, chapter_number, tone):
+        # Each chapter only needs its own outline, which is what lets us write them side by side
+        outline = self.load_from_file(f'outline_chapter_{chapter_number}.txt')
+        self.prompts.update(tone=tone)
+        if chapter_number == 1:
+            return self.prompts.messages("first_chapter", outline=outline)
+        return self.prompts.messages("chapter", chapter_number=chapter_number, outline=outline)
+
     def generate_first_chapter(self, tone):
-        outline = self.load_from_file('outline_chapter_1.txt')
-        prompt = [
-            {
-                "role": "system",
-                "content": f"As an expert narrative writer, you are tasked with crafting the opening chapter of a novel. This chapter must embody a {tone} tone, capturing the essence of the story's beginning as outlined. Your objective is to transform the provided chapter outline into engaging and coherent narrative prose. Focus on developing the scenes, actions, dialogues, and character emotions detailed in the outline, ensuring a rich and immersive reading experience. The final output should present a seamless narrative that adheres closely to the outline, emphasizing storytelling over conversation or extraneous details."
-            },
-            {
-                "role": "user",
-                "content": f"Based on the outline provided below, write a detailed narrative for Chapter 1. The narrative should vividly bring the outline to life, aligning closely with both the story's premise and the specified {tone} tone. Your narrative should include only the story content as informed by the outline, without deviating into unrelated discussions or dialogue with the reader.\n\nOutline for Chapter 1:\n\n{outline}\n\n."
-            }
-        ]
-        first_chapter = self.generate_content(prompt, 'chapter_01.txt')
+        first_chapter = self.generate_chapter(1, tone)
         return first_chapter
 
+    def draft_chapter(self, chapter_number, tone):
+        """
+        Writes one chapter. Returns (filename, content, already_saved) and leaves saving
+        to the caller so files land on disk in chapter order (streamed chapters are the
+        exception: they are written token by token as they arrive). A chapter that still
+        fails after every retry comes back with content None.
+        """
+        filename = f'chapter_{chapter_number:02d}.txt'  # Ensuring consistent file naming
+        try:
+            if self.scene_mode:
+                content, already_saved = self.write_chapter_in_scenes(chapter_number, tone), False
+            else:
+                content, already_saved = self.produce_content(self.chapter_prompt(chapter_number, tone), filename)
+        except GenerationError as e:
+            print(str(e))
+            return filename, None, False
+        return filename, content, already_saved
+
+    def generate_chapter(self, chapter_number, tone):
+        if self.scene_mode:
+            chapter_content = self.write_chapter_in_scenes(chapter_number, tone)
+            self.save_to_file(f'chapter_{chapter_number:02d}.txt', chapter_content)
+            return chapter_content
+        return self.generate_content(self.chapter_prompt(chapter_number, tone), f'chapter_{chapter_number:02d}.txt')
+
+    def split_into_scenes(self, outline):
+        """
+        Breaks a chapter outline into scenes of 'beats_per_scene' beats. A beat is a bullet
+        or numbered line of the outline; an outline without any is split on sentences.
+        """
+        lines = [line.strip() for line in (outline or "").splitlines() if line.strip()]
+        beats = [re.sub(r'^(?:[-*+]|\d+[.)])\s*', '', line) for line in lines if re.match(r'^(?:[-*+]|\d+[.)])\s', line)]
+        if not beats:
+            beats = [sentence for sentence in re.split(r'(?<=[.!?])\s+', " ".join(lines)) if sentence]
+        if not beats:
+            return [[outline or ""]]
+        return [beats[i:i + self.beats_per_scene] for i in range(0, len(beats), self.beats_per_scene)]
+
+    def scene_prompt(self, chapter_number, tone, scenes, index):
+        # The neighbouring scenes' beats are the context carried across; they are known up
+        # front, so the scenes don't have to wait for each other
+        previously = "; ".join(scenes[index - 1]) if index > 0 else "This is the opening scene of the chapter."
+        coming_next = "; ".join(scenes[index + 1]) if index + 1 < len(scenes) else "This scene closes the chapter."
+        self.prompts.update(tone=tone)
+        return self.prompts.messages("scene", scene_number=index + 1, scene_count=len(scenes), chapter_number=chapter_number,
+                                     scene_words=self.scene_words, beats="\n".join(f"- {beat}" for beat in scenes[index]),
+                                     previously=previously, coming_next=coming_next)
+
+    def write_chapter_in_scenes(self, chapter_number, tone):
+        """
+        Writes a chapter as a series of bounded scene requests, run side by side, each one
+        continued automatically if it stops at scene_max_tokens. Scenes are kept as
+        chapter_NN_scene_MM.txt so a resumed run only redoes the ones that failed.
+        """
+        outline = self.load_from_file(f'outline_chapter_{chapter_number}.txt')
+        scenes = self.split_into_scenes(outline)
+
+        def write_scene(index):
+            filename = f'chapter_{chapter_number:02d}_scene_{index + 1:02d}.txt'
+            content, already_saved = self.produce_content(self.scene_prompt(chapter_number, tone, scenes, index), filename,
+                                                          max_tokens=self.scene_max_tokens, continuations=self.max_continuations)
+            if not already_saved:
+                self.save_to_file(filename, content)
+            return content.strip()
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(scenes))) as executor:
+            return "\n\n".join(executor.map(write_scene, range(len(scenes))))
 
     def generate_remaining_chapters(self, num_chapters, tone):
         chapters = []
-        for i in range(2, num_chapters + 1):
-            outline = self.load_from_file(f'outline_chapter_{i}.txt')
-            
-            prompt = [
-                {
-                    "role": "system",
-                    "content": f"As a skilled narrative writer, your task is to write Chapter {i} of a novel, ensuring it is infused with a {tone} tone. This chapter must seamlessly continue the story from the previous chapters, based solely on the provided outline. Your goal is to craft a narrative that is engaging, coherent, and true to the story's established direction. Focus on narrative development - including scenes, character dynamics, and plot progression - as indicated in the outline. Ensure the narrative is self-contained and consistent with the story's overarching themes and character arcs."
-                },
-                {
-                    "role": "user",
-                    "content": f"Using the outline for Chapter {i} below, craft a detailed narrative that effectively continues the story. This narrative should adhere to the specified {tone} tone and align with the overarching story arc, without assuming additional context not present in the outline. Ensure the chapter contributes meaningfully to the narrative progression and character development outlined thus far.\n\nOutline for Chapter {i}:\n\n{outline}\n\n."
-                }
-            ]
-            chapter_content = self.generate_content(prompt, f'chapter_{i:02d}.txt')  # Ensuring consistent file naming
-            chapters.append(chapter_content)
+        # executor.map hands results back in chapter order, however the requests finish
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            drafts = executor.map(lambda i: self.draft_chapter(i, tone), range(2, num_chapters + 1))
+            for filename, chapter_content, already_saved in drafts:
+                if chapter_content is not None and not already_saved:
+                    self.save_to_file(filename, chapter_content)
+                chapters.append(chapter_content)
+
+        # Every other chapter is safely on disk by now; a resumed run only redoes these
+        failed = [str(i) for i, chapter in enumerate(chapters, start=2) if chapter is None]
+        if failed:
+            raise GenerationError(f"Chapters {', '.join(failed)} could not be generated.")
         return chapters
 
     
-    def get_user_feedback(self, content_type, content, context="", component_name=None):
-        """Prompt the user for feedback on the generated content."""
+    def get_user_feedback(self, content_type, content, context="", component_name=None, filename=None):
+        """
+        Prompt the user for feedback on the generated content. If the step behind 'filename'
+        produced several candidates, 'next' swaps in the next best one without another call.
+        """
         print(f"\n🧐 Here's the {content_type} we've crafted for you:\n")
         print(content)
-            
-        feedback = input(f"\n🤔 Thoughts on this {content_type}? If you have feedback or want a revision, let us know. Otherwise, type 'perfect' to move on: ").strip().lower()
-        
+
+        alternatives = self._alternatives.get(filename) or []
+        offer = f" Or type 'next' for another take ({len(alternatives)} waiting)." if alternatives else ""
+        feedback = input(f"\n🤔 Thoughts on this {content_type}? If you have feedback or want a revision, let us know. Otherwise, type 'perfect' to move on:{offer} ").strip().lower()
+
+        if feedback == 'next' and alternatives:
+            return self.get_user_feedback(content_type, alternatives.pop(0), context, component_name, filename)
+
         if feedback == 'perfect':
             if component_name:  # Delete feedback file if it exists
                 feedback_file_path = os.path.join('feedback_files', f'{component_name}_feedback.txt')  # Assuming a 'feedback_files' directory
@@ -271,20 +612,18 @@ class StoryGenerator:
             return self.revise_content(content, feedback, context, component_name)
 
     def revise_content(self, original_content, feedback, context, component_name=None):
+        # The content being revised has to go in whole; the background context gets what's left of the budget
+        context = truncate_to_tokens(context, max(self.context_budget - count_tokens(original_content), 200))
+
         # Construct the new prompt
-        prompt_content = [
-            {
-                "role": "system",
-                "content": "You are a meticulous revision specialist, skilled in refining content based on feedback. Your primary goal is to enhance the original content while preserving its core essence. It's crucial to avoid chatbot-like behavior and only focus on the task of revision."
-            },
-            {
-                "role": "user",
-                "content": f"Given the detailed feedback: '{feedback}', and the context: '{context}', adeptly refine the following content without straying from the feedback's intent: '{original_content}'. Ensure the revised content is clear and concise without any additional commentary."
-            }
-        ]
+        prompt_content = self.prompts.messages("revision", feedback=feedback, context=context, original_content=original_content)
 
-        
-        revised_content = self.call_openai_api(prompt_content)
+        try:
+            revised_content = self.complete(prompt_content, step='revision').content
+        except Exception as e:
+            # Nothing is lost: carry on with the version we already have
+            print(f"Couldn't revise this ({str(e)}), so keeping the previous version.")
+            return original_content
 
         if component_name:  # Save the revised content in a feedback file
             feedback_file_path = os.path.join('feedback_files', f'{component_name}_feedback.txt')  # Assuming a 'feedback_files' directory
@@ -294,13 +633,58 @@ class StoryGenerator:
         return revised_content
 
 
-    def compile_book(self, title, toc, chapters):
-        compiled_content = f"Title: {title}\n\nTable of Contents:\n{toc}\n\n"
+    def compile_book(self, title, toc, num_chapters=None):
+        # Chapters are streamed from their files on disk, so nothing has to be held in memory here
+        return exporters.compile_book(self.base_dir, title, toc, formats=self.export_formats,
+                                      toc_from_headers=self.toc_from_headers, num_chapters=num_chapters)
+
+    def report_run_profile(self, show=True):
+        """Prints the per-step call profile, saves it as run_profile.txt and updates the Prometheus file."""
+        profile = self.telemetry.format_summary() + "\n\n" + self.prompts.format_stats()
+        if show:
+            print("\nWhere the time went:\n" + profile)
+        if self.base_dir:
+            self.save_to_file('run_profile.txt', profile + "\n")
+        self.telemetry.write_prometheus()
+
+    def report_cache_stats(self):
+        if self.cache is None:
+            return
+        stats = self.cache.stats()
+        print(f"\nResponse cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+              f"{stats['entries']} entries / {stats['bytes'] / (1024 * 1024):.1f} MB on disk.")
+
+    def build_pipeline(self, story_idea, tone, num_chapters):
+        """
+        Declares the auto-mode book as a task graph. Each node lists the results it
+        needs, so chapter i's prose can start as soon as outline i exists, while
+        outline i+1 is still being written.
+        """
+        graph = TaskGraph()
+        graph.add('premise', lambda: self.generate_premise(story_idea, tone))
+        graph.add('title', lambda premise: self.generate_title(premise, story_idea, tone), ['premise'])
+        graph.add('toc', lambda premise: self.generate_toc(premise, story_idea, tone, num_chapters), ['premise'])
+        graph.add('content_types', lambda toc, premise: self.identify_content_types(toc, story_idea, premise, tone), ['toc', 'premise'])
+        graph.add('refined_content_types', lambda content_types, premise: self.refine_content_types(content_types, premise, tone), ['content_types', 'premise'])
+        graph.add('deepened_narrative', lambda refined, premise: self.deepen_narrative(refined, premise, tone), ['refined_content_types', 'premise'])
+        graph.add('extracted_chapters', lambda deepened: self.extract_chapters_regex(), ['deepened_narrative'])
+
+        # Outlines are declared before chapters so that, when both become ready at once,
+        # the next outline (the critical path) is started first.
+        graph.add('outline_1', lambda premise, extracted: self.generate_first_outline(premise, num_chapters), ['premise', 'extracted_chapters'])
+        for i in range(2, num_chapters + 1):
+            graph.add(f'outline_{i}', lambda previous, extracted, i=i: self.generate_outline(i), [f'outline_{i - 1}', 'extracted_chapters'])
+        for i in range(1, num_chapters + 1):
+            graph.add(f'chapter_{i}', lambda outline, i=i: self.generate_chapter(i, tone), [f'outline_{i}'])
 
-        for i, chapter in enumerate(chapters):
-            compiled_content += f"\nChapter {i+1}:\n\n{chapter}\n"
+        chapter_tasks = [f'chapter_{i}' for i in range(1, num_chapters + 1)]
+        graph.add('compiled_book', lambda title, toc, *chapters: self.compile_book(title, toc, num_chapters), ['title', 'toc'] + chapter_tasks)
+        return graph
 
-        self.save_to_file('compiled_book.txt', compiled_content)
+    def run_auto_pipeline(self, story_idea, tone, num_chapters, show_progress=True):
+        graph = self.build_pipeline(story_idea, tone, num_chapters)
+        on_start = (lambda name: print(f"  ... working on {name}")) if show_progress else None
+        return graph.run(max_workers=self.max_concurrency, on_start=on_start)
 
     def main(self):
 
@@ -315,39 +699,51 @@ class StoryGenerator:
         while mode not in ["auto", "manual"]:
             mode = input("Wasn't that simple? 'Auto' or 'Manual'. Try again, Sherlock: ").strip().lower()
 
+        try:
+            if mode == 'auto':
+                # Nobody to wait on, so run every step as soon as its inputs are ready
+                print("\nFiring up the whole assembly line at once. Sit back...")
+                self.run_auto_pipeline(story_idea, tone, num_chapters)
+            else:
+                self.run_manual_pipeline(story_idea, tone, num_chapters)
+        except GenerationError as e:
+            print(f"\n{str(e)}\nNot finished: {', '.join(self.manifest.failed_steps())}. "
+                  f"Everything else is saved. Run again with --resume to redo only what's missing.")
+            return
+        finally:
+            self.report_run_profile()
+            self.report_cache_stats()
+        print("\nVoilà! Your masterpiece is ready. (Or so you think!) Enjoy reading it and... good luck!")
+
+    def run_manual_pipeline(self, story_idea, tone, num_chapters):
+        """Runs the steps one after another, asking for feedback on each. Raises GenerationError like the Auto pipeline."""
         # Step 2: Generate Premise
         print("\nAlright, diving deep into the vast AI brain to get you a premise...")
         premise = self.generate_premise(story_idea, tone)
-        if mode == 'manual':
-            premise = self.get_user_feedback("premise", premise, "Your vague idea: " + story_idea)
+        premise = self.get_user_feedback("premise", premise, "Your vague idea: " + story_idea, filename='premise.txt')
 
         # Step 3: Generate Title
         print("\nAttempting to coin a title that does justice to your... unique idea.")
         title = self.generate_title(premise, story_idea, tone)
-        if mode == 'manual':
-            title = self.get_user_feedback("title", title)
+        title = self.get_user_feedback("title", title, filename='title.txt')
 
         # Step 4: Generate Table of Contents
         print("\nChiseling out a table of contents... ")
         toc = self.generate_toc(premise, story_idea, tone, num_chapters)
-        if mode == 'manual':
-            toc = self.get_user_feedback("table of contents", toc, "Your premise (again): " + premise)
+        toc = self.get_user_feedback("table of contents", toc, "Your premise (again): " + premise, filename='toc.txt')
 
         # Step 5: Identify Content Types
         print("\nDeciphering the mysteries of each chapter... 🕵️")
         initial_content_types = self.identify_content_types(toc, story_idea, premise, tone)
-        if mode == 'manual':
-            initial_content_types = self.get_user_feedback("initial content types", initial_content_types, "Table of contents (I hope you remember): " + toc)
+        initial_content_types = self.get_user_feedback("initial content types", initial_content_types, "Table of contents (I hope you remember): " + toc)
 
         refined_content_types = self.refine_content_types(initial_content_types, premise, tone)
-        if mode == 'manual':
-            refined_content_types = self.get_user_feedback("refined content types", refined_content_types, "The initial (not-so-perfect) types: " + initial_content_types)
+        refined_content_types = self.get_user_feedback("refined content types", refined_content_types, "The initial (not-so-perfect) types: " + initial_content_types)
 
         # Step 6: Deepen Narrative
         print("\nSprinkling some depth into this narrative... Let's not make it too shallow.")
         deepened_narrative = self.deepen_narrative(refined_content_types, premise, tone)
-        if mode == 'manual':
-            deepened_narrative = self.get_user_feedback("deepened narrative", deepened_narrative, "The refined (slightly better) content types: " + refined_content_types)
+        deepened_narrative = self.get_user_feedback("deepened narrative", deepened_narrative, "The refined (slightly better) content types: " + refined_content_types)
 
         # Step 7: Extract Chapters
         print("\nExtracting chapters... Let's hope they make some sense!")
@@ -357,10 +753,9 @@ class StoryGenerator:
         # Step 8: Generate Chapter Outlines
         print("\nSketching the first chapter's outline... Fingers crossed it's legible!")
         self.generate_first_outline(premise,num_chapters)
-        if mode == 'manual':
-            for i in range(1, num_chapters + 1):  # Iterate through all chapters
-                outline = self.load_from_file(f"outline_chapter_{i}.txt")
-                outline = self.get_user_feedback(f"outline for chapter {i}", outline, "The premise that started it all: " + premise)
+        for i in range(1, num_chapters + 1):  # Iterate through all chapters
+            outline = self.load_from_file(f"outline_chapter_{i}.txt")
+            outline = self.get_user_feedback(f"outline for chapter {i}", outline, "The premise that started it all: " + premise)
 
         print("\nWorking on the remaining outlines... Expecting some Picasso-level sketches!")
         self.generate_remaining_outlines(num_chapters)
@@ -369,25 +764,151 @@ class StoryGenerator:
         # Step 9: Generate First Chapter
         print("\nRolling out the red carpet for the first chapter... Drumroll, please!")
         first_chapter = self.generate_first_chapter(tone)
-        if mode == 'manual':
-            first_chapter = self.get_user_feedback("first chapter", first_chapter, "Your premise (in case you forgot): " + premise)
+        first_chapter = self.get_user_feedback("first chapter", first_chapter, "Your premise (in case you forgot): " + premise,
+                                               filename='chapter_01.txt')
+        self.save_to_file('chapter_01.txt', first_chapter)  # The book is compiled from the chapter files
 
         # Step 10: Generate Remaining Chapters
         print("\nSummoning the... chapters. Hope they're as interesting as you think!")
         remaining_chapters = self.generate_remaining_chapters(num_chapters, tone)
-        if mode == 'manual':
-            for i, chapter in enumerate(remaining_chapters, 2):  # Start from chapter 2
-                print(f"\nAlright, critique chapter {i} if you must...")
-                remaining_chapters[i-2] = self.get_user_feedback(f"chapter {i}", chapter, "Your premise: " + premise)
+        for i, chapter in enumerate(remaining_chapters, 2):  # Start from chapter 2
+            print(f"\nAlright, critique chapter {i} if you must...")
+            remaining_chapters[i-2] = self.get_user_feedback(f"chapter {i}", chapter, "Your premise: " + premise,
+                                                             filename=f'chapter_{i:02d}.txt')
+            self.save_to_file(f'chapter_{i:02d}.txt', remaining_chapters[i-2])
 
         # Step 11: Compile Book
         print("\nStitching it all together. Fingers crossed!")
-        all_chapters = [first_chapter] + remaining_chapters
-        self.compile_book(title, toc, all_chapters)
-
-        print("\nVoilà! Your masterpiece is ready. (Or so you think!) Enjoy reading it and... good luck!")
+        self.compile_book(title, toc, num_chapters)
+
+
+def load_jobs(path):
+    """
+    Reads book specs from a JSONL file (one JSON object per line) or a YAML file holding
+    a list of them. Each spec needs 'title', 'idea', 'tone' and 'chapters'.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml  # Only needed for YAML job files
+            jobs = yaml.safe_load(f) or []
+        else:
+            jobs = [json.loads(line) for line in f if line.strip()]
+
+    for number, job in enumerate(jobs, start=1):
+        missing = [key for key in ('title', 'idea', 'tone', 'chapters') if key not in job]
+        if missing:
+            raise ValueError(f"Job {number} in {path} is missing {', '.join(missing)}.")
+
+    # Two books with the same title would write into the same folder at once
+    folders = {}
+    for number, job in enumerate(jobs, start=1):
+        folder = StoryGenerator.sanitize_filename(str(job['title']))
+        if folder in folders:
+            raise ValueError(f"Jobs {folders[folder]} and {number} in {path} both have the title '{job['title']}'.")
+        folders[folder] = number
+    return jobs
+
+
+def run_batch(jobs, max_books=2, max_requests=8, summary_path=None, **generator_options):
+    """
+    Generates every book in 'jobs' through the auto-mode pipeline without asking anything.
+    Up to 'max_books' books are worked on at once and they share one endpoint pool, so
+    'max_requests' caps the requests in flight across the whole batch. A per-book status
+    and timing summary is written to 'summary_path' (JSON) and returned.
+    """
+    # One Prometheus file for the whole batch, written once every book is done
+    prometheus_path = generator_options.pop('prometheus_path', None)
+    batch_telemetry = Telemetry(prometheus_path=prometheus_path)
+    first = StoryGenerator(max_concurrency=max_requests, **generator_options)
+    first.pool.max_total_in_flight = max_requests
+    shared = {"pool": first.pool, "cache": first.cache}
+
+    def make_book(job):
+        started = time.perf_counter()
+        record = {"title": job['title'], "chapters": job['chapters'], "status": "ok", "error": None}
+        generator = None
+        try:
+            # A bad spec fails this book only, not the batch
+            record["chapters"] = num_chapters = int(job['chapters'])
+            generator = StoryGenerator(max_concurrency=max_requests, **dict(generator_options, **shared))
+            generator.open_project(job['title'])
+            generator.run_auto_pipeline(job['idea'], job['tone'], num_chapters, show_progress=False)
+            record["output"] = os.path.join(generator.base_dir, 'compiled_book.txt')
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+        finally:
+            if generator is not None and generator.base_dir:
+                generator.report_run_profile(show=False)
+                record["profile"] = generator.telemetry.summary()
+                generator.telemetry.close()
+                batch_telemetry.merge(generator.telemetry)
+        record["seconds"] = round(time.perf_counter() - started, 2)
+        print(f"[{record['status']}] {record['title']} ({record['seconds']}s)")
+        return record
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, max_books)) as executor:
+        books = list(executor.map(make_book, jobs))
+    elapsed = time.perf_counter() - started
+    batch_telemetry.write_prometheus()
+
+    finished = sum(1 for book in books if book["status"] == "ok")
+    summary = {
+        "books": books,
+        "succeeded": finished,
+        "failed": len(books) - finished,
+        "seconds": round(elapsed, 2),
+        "books_per_hour": round(finished * 3600 / elapsed, 2) if elapsed > 0 else None,
+        "endpoints": first.pool.stats(),
+        "cache": first.cache.stats() if first.cache is not None else None,
+    }
+    summary_path = summary_path or os.path.join('generated_content', 'batch_summary.json')
+    os.makedirs(os.path.dirname(summary_path) or '.', exist_ok=True)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"\n{finished}/{len(books)} books done in {elapsed:.0f}s "
+          f"({summary['books_per_hour']} books/hour). Summary saved to {summary_path}")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate whole books with a local LLM. Run without arguments for the interactive mode.")
+    parser.add_argument('--batch', metavar='JOBS', help="JSONL or YAML file of book specs (title, idea, tone, chapters) to generate unattended")
+    parser.add_argument('--endpoint', action='append', dest='endpoints', metavar='URL', help="OpenAI-compatible server to use; repeat for several")
+    parser.add_argument('--max-books', type=int, default=2, help="books worked on at the same time in batch mode")
+    parser.add_argument('--max-requests', type=int, default=8, help="requests in flight across the whole batch")
+    parser.add_argument('--summary', help="where to write the batch summary (default generated_content/batch_summary.json)")
+    parser.add_argument('--stream', action='store_true', help="stream tokens into .partial files as they arrive")
+    parser.add_argument('--resume', action='store_true', help="only redo steps that failed or whose prompt changed since the last run")
+    parser.add_argument('--scenes', action='store_true', help="write each chapter scene by scene in bounded, parallel requests")
+    parser.add_argument('--candidates', type=int, default=1, metavar='N', help="write N candidates for the premise, title, TOC and chapters and keep the best")
+    parser.add_argument('--formats', nargs='+', default=['txt'], choices=exporters.FORMATS, help="book formats to write (default: txt)")
+    parser.add_argument('--toc-from-headers', action='store_true', help="build the table of contents from each chapter's first line")
+    parser.add_argument('--export', metavar='FOLDER', help="re-export an existing project folder in --formats and exit")
+    parser.add_argument('--prometheus', metavar='FILE', help="also write per-step call metrics to this Prometheus textfile")
+    parser.add_argument('--no-cache', action='store_true', help="don't use the shared response cache")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    generator = StoryGenerator()
-    generator.setup_project()
\ No newline at end of file
+    args = parse_args()
+    options = {"endpoints": args.endpoints, "stream": args.stream, "resume": args.resume, "prometheus_path": args.prometheus,
+               "export_formats": args.formats, "toc_from_headers": args.toc_from_headers, "scene_mode": args.scenes,
+               "candidates": args.candidates}
+    if args.no_cache:
+        options["cache_path"] = None
+
+    if args.export:
+        folder = args.export
+        title = open(os.path.join(folder, 'title.txt'), encoding='utf-8').read() if os.path.exists(os.path.join(folder, 'title.txt')) else os.path.basename(folder)
+        toc = open(os.path.join(folder, 'toc.txt'), encoding='utf-8').read() if os.path.exists(os.path.join(folder, 'toc.txt')) else None
+        for path in exporters.compile_book(folder, title, toc, formats=args.formats, toc_from_headers=args.toc_from_headers):
+            print(f"Wrote {path}")
+    elif args.batch:
+        run_batch(load_jobs(args.batch), max_books=args.max_books, max_requests=args.max_requests,
+                  summary_path=args.summary, **options)
+    else:
+        generator = StoryGenerator(**options)
+        generator.setup_project()
\ No newline at end of file
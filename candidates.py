@@ -0,0 +1,61 @@
+import math
+import re
+
+# Rough word counts a good answer lands near; anything within 2x either way isn't penalised
+LENGTH_TARGETS = {"premise": 150, "title": 8, "toc": None, "chapter": 1500}
+
+# Openers that mean the model is talking to us instead of writing the book
+CHATTER = re.compile(r"^\s*(sure|certainly|of course|here is|here's|here are|as an ai|i'm sorry|i can't)\b", re.IGNORECASE)
+
+
+def repetition(text, n=3):
+    """Share of the word n-grams in 'text' that already appeared earlier in it (0 = none repeat)."""
+    words = re.findall(r"\w+", (text or "").lower())
+    grams = [tuple(words[i:i + n]) for i in range(len(words) - n + 1)]
+    if not grams:
+        return 0.0
+    return 1.0 - len(set(grams)) / len(grams)
+
+
+def length_penalty(text, target):
+    if not target:
+        return 0.0
+    words = max(len((text or "").split()), 1)
+    return max(abs(math.log2(words / target)) - 1.0, 0.0)
+
+
+def format_score(step, text, num_chapters=None):
+    """1.0 when the answer has the shape the step asked for, less the further off it is."""
+    text = (text or "").strip()
+    if not text:
+        return 0.0
+    if step == "title":
+        lines = [line for line in text.splitlines() if line.strip()]
+        return 0.5 * bool(re.match(r"\W*title:", lines[0], re.IGNORECASE)) + 0.5 * (len(lines) == 1)
+    if step == "toc" and num_chapters:
+        found = {int(number) for number in re.findall(r"chapter\s+(\d+)", text, re.IGNORECASE)}
+        listed = len(found & set(range(1, num_chapters + 1)))
+        extra = len(found - set(range(1, num_chapters + 1)))
+        return max(listed - extra, 0) / num_chapters
+    return 1.0
+
+
+def score_candidate(step, text, num_chapters=None, length_target=None):
+    """
+    A cheap, local quality guess: no LLM call, just whether the answer follows the
+    requested format, how close it is to a sensible length, how much it repeats
+    itself and whether it opens with chatter. Higher is better.
+    """
+    target = length_target if length_target is not None else LENGTH_TARGETS.get(step)
+    return (
+        2.0 * format_score(step, text, num_chapters)
+        - 2.0 * repetition(text)
+        - 0.5 * length_penalty(text, target)
+        - 1.0 * bool(CHATTER.match(text or ""))
+    )
+
+
+def rank_candidates(step, texts, num_chapters=None, length_target=None):
+    """The distinct non-empty candidates, best first. Ties keep the order the server returned them in."""
+    texts = list(dict.fromkeys(text for text in texts if text and text.strip()))
+    return sorted(texts, key=lambda text: -score_candidate(step, text, num_chapters, length_target))
@@ -0,0 +1,105 @@
+import re
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20,
+}
+ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+# A well-formed numeral up to 399. Leaving out d and m keeps words like "mix" or "did"
+# from reading as chapter numbers, and no book here gets near 400 chapters.
+ROMAN = r"(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})"
+
+# Matched against one line at a time, so the cost is linear in the size of the input.
+# Accepts "Chapter 3: ...", "## Chapter 3 - ...", "- **Chapter III** – ...", "4. Chapter Four: ...",
+# "Ch. 5.", "Part 2" and friends. After the number there must be a separator or the end
+# of the line, so a sentence that merely starts with "Chapter 3 ends..." isn't a header.
+# "Part" and "Section" only count when there are no "Chapter" headings at all, since
+# otherwise they are subdivisions inside a chapter.
+HEADER = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]*)?(?:(?:[-*+>]|\d{1,4}[.)])[ \t]+)?"
+    r"(?:\*\*|__)?"
+    r"(?P<kind>chapter|ch\.|section|part)[ \t]+"
+    r"(?P<number>\d{1,4}|" + ROMAN + "|" + "|".join(NUMBER_WORDS) + r")\b"
+    r"[ \t]*(?:\*\*|__)?[ \t]*"
+    r"(?:(?P<sep>[:.)\-–—])(?P<title>.*))?$",
+    re.IGNORECASE,
+)
+
+
+class ChapterRecord:
+    """One chapter found in a longer text: its number, heading and where it sits in the text."""
+    def __init__(self, number, title, start, body_start, end, line, kind="chapter"):
+        self.number = number
+        self.title = title
+        self.kind = kind              # "chapter", "part" or "section"
+        self.start = start            # Offset of the heading line
+        self.body_start = body_start  # Offset just after the heading line
+        self.end = end                # Offset where the next chapter (or the text) starts
+        self.line = line              # 1-based line number of the heading
+
+    def text(self, source):
+        """The chapter, heading included, cut out of the text it was found in."""
+        return source[self.start:self.end]
+
+    def __repr__(self):
+        return f"ChapterRecord(number={self.number}, title={self.title!r}, start={self.start}, end={self.end})"
+
+
+def parse_number(raw):
+    raw = raw.lower()
+    if raw.isdigit():
+        return int(raw)
+    if raw in NUMBER_WORDS:
+        return NUMBER_WORDS[raw]
+    total = 0
+    previous = 0
+    for letter in reversed(raw):
+        value = ROMAN_VALUES[letter]
+        total = total - value if value < previous else total + value
+        previous = max(previous, value)
+    return total
+
+
+def match_header(line):
+    """Returns (kind, number, title) if 'line' is a chapter heading, otherwise None."""
+    if len(line) > 300:
+        return None  # Headings are short; don't bother scanning paragraphs
+    match = HEADER.match(line)
+    if not match:
+        return None
+    number = match.group("number")
+    if not number.isdigit() and not (number.isupper() or number.islower()):
+        return None  # "Chapter Vi" is a typo or a word, not a numeral
+    kind = match.group("kind").lower()
+    kind = "chapter" if kind in ("chapter", "ch.") else kind
+    # "**Chapter 3: The Storm** - Rising action": the bold markers aren't part of the title
+    title = re.sub(r"\*\*|__", "", match.group("title") or "")
+    return kind, parse_number(number), re.sub(r"\s{2,}", " ", title).strip(" *_#")
+
+
+def split_chapters(lines):
+    """
+    Finds chapter headings in a single pass over 'lines' (a string, a list of lines or an
+    open file) and returns a ChapterRecord per chapter, with character offsets into the
+    full text. Anything before the first heading is treated as preamble and skipped.
+    If there are "Chapter" headings, "Part" and "Section" lines stay inside their chapter.
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines(keepends=True)
+
+    records = []
+    offset = 0
+    for line_number, line in enumerate(lines, start=1):
+        header = match_header(line.rstrip("\r\n"))
+        if header is not None:
+            kind, number, title = header
+            records.append(ChapterRecord(number, title, offset, offset + len(line), None, line_number, kind))
+        offset += len(line)
+
+    if any(record.kind == "chapter" for record in records):
+        records = [record for record in records if record.kind == "chapter"]
+    # Each chapter runs up to the next one kept, the last one to the end of the text
+    for record, following in zip(records, records[1:] + [None]):
+        record.end = following.start if following is not None else offset
+    return records
@@ -0,0 +1,171 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from openai import OpenAI
+
+
+class Endpoint:
+    """One OpenAI-compatible server (LM Studio, llama.cpp, vLLM...) and its bookkeeping."""
+    def __init__(self, base_url, api_key="not-needed", max_in_flight=4):
+        self.base_url = base_url
+        # The pool does its own retrying on other servers, so the SDK shouldn't hold a slot retrying one
+        self.client = OpenAI(base_url=base_url, api_key=api_key, max_retries=0)
+        self.max_in_flight = max(1, max_in_flight)
+        self.in_flight = 0
+        self.latency = None  # Smoothed seconds per request, None until the first one finishes
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def is_healthy(self, now):
+        return now >= self.unhealthy_until
+
+    def __repr__(self):
+        return f"Endpoint({self.base_url!r}, in_flight={self.in_flight}/{self.max_in_flight})"
+
+
+class EndpointPool:
+    """
+    Spreads requests over several servers. Each endpoint has its own cap on requests in
+    flight; a new request goes to the endpoint with the fewest outstanding requests, or
+    with strategy="latency" to the one expected to answer soonest. An endpoint that
+    fails 'failure_threshold' times in a row sits out for 'cooldown' seconds, and a
+    failed request is retried on another endpoint. 'max_total_in_flight' optionally caps
+    the requests in flight across the whole pool, e.g. when many books share it.
+    """
+    def __init__(self, endpoints, strategy="least_outstanding", failure_threshold=2, cooldown=30.0,
+                 max_total_in_flight=None):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint.")
+        if strategy not in ("least_outstanding", "latency"):
+            raise ValueError(f"Unknown routing strategy '{strategy}'.")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_total_in_flight = max_total_in_flight
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_specs(cls, specs, default_api_key="not-needed", default_max_in_flight=4, **kwargs):
+        """
+        Builds a pool from plain URLs or dicts like
+        {"base_url": "http://gpu-box:1234/v1", "max_in_flight": 8, "api_key": "..."}.
+        """
+        endpoints = []
+        for spec in specs:
+            if isinstance(spec, str):
+                spec = {"base_url": spec}
+            endpoints.append(Endpoint(
+                spec["base_url"],
+                api_key=spec.get("api_key", default_api_key),
+                max_in_flight=spec.get("max_in_flight", default_max_in_flight),
+            ))
+        return cls(endpoints, **kwargs)
+
+    @property
+    def capacity(self):
+        total = sum(endpoint.max_in_flight for endpoint in self.endpoints)
+        if self.max_total_in_flight is not None:
+            total = min(total, self.max_total_in_flight)
+        return total
+
+    def _score(self, endpoint):
+        if self.strategy == "latency" and endpoint.latency is not None:
+            # Expected time until this request would be answered if queued here
+            return ((endpoint.in_flight + 1) * endpoint.latency / endpoint.max_in_flight, endpoint.in_flight)
+        return (endpoint.in_flight / endpoint.max_in_flight, endpoint.latency or 0.0)
+
+    def _pick(self, exclude):
+        if self.max_total_in_flight is not None:
+            if sum(e.in_flight for e in self.endpoints) >= self.max_total_in_flight:
+                return None
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+        healthy = [e for e in candidates if e.is_healthy(now)]
+        if not healthy:
+            # Everything is sitting out: rather than stall the book, try whoever recovers first
+            healthy = [min(candidates, key=lambda e: e.unhealthy_until)]
+        free = [e for e in healthy if e.in_flight < e.max_in_flight]
+        if not free:
+            return None
+        return min(free, key=self._score)
+
+    def acquire(self, exclude=()):
+        with self._condition:
+            while True:
+                endpoint = self._pick(exclude)
+                if endpoint is not None:
+                    endpoint.in_flight += 1
+                    endpoint.requests += 1
+                    return endpoint
+                self._condition.wait(timeout=1.0)
+
+    def release(self, endpoint, elapsed=None, ok=True):
+        with self._condition:
+            endpoint.in_flight -= 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.unhealthy_until = 0.0
+                if elapsed is not None:
+                    endpoint.latency = elapsed if endpoint.latency is None else 0.7 * endpoint.latency + 0.3 * elapsed
+            else:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                was_healthy = endpoint.is_healthy(time.monotonic())
+                if endpoint.consecutive_failures >= self.failure_threshold:
+                    endpoint.unhealthy_until = time.monotonic() + self.cooldown
+                    if was_healthy:
+                        print(f"Taking {endpoint.base_url} out of rotation for {self.cooldown:.0f}s after {endpoint.consecutive_failures} failures.")
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, exclude=()):
+        """Holds a slot on one endpoint for the duration of the 'with' block."""
+        endpoint = self.acquire(exclude)
+        started = time.perf_counter()
+        try:
+            yield endpoint
+        except Exception:
+            self.release(endpoint, ok=False)
+            raise
+        self.release(endpoint, time.perf_counter() - started)
+
+    def call(self, request_fn, attempts=None):
+        """
+        Runs request_fn(endpoint) on the best endpoint, moving on to another endpoint when
+        it raises. Each healthy endpoint is tried at most once; the last error is re-raised
+        after that, and trying again later is left to the caller's backoff.
+        """
+        if attempts is None:
+            now = time.monotonic()
+            with self._condition:
+                attempts = max(sum(1 for e in self.endpoints if e.is_healthy(now)), 1)
+        tried = []
+        last_error = None
+        for _ in range(attempts):
+            try:
+                with self.lease(exclude=tried) as endpoint:
+                    return request_fn(endpoint)
+            except Exception as e:
+                last_error = e
+                tried.append(endpoint)
+                if len(self.endpoints) > 1:
+                    print(f"Request to {endpoint.base_url} failed ({str(e)}), trying another server...")
+        raise last_error
+
+    def stats(self):
+        with self._condition:
+            return [
+                {
+                    "base_url": e.base_url,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                    "in_flight": e.in_flight,
+                    "latency": e.latency,
+                    "healthy": e.is_healthy(time.monotonic()),
+                }
+                for e in self.endpoints
+            ]
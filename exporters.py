@@ -0,0 +1,205 @@
+import html
+import os
+import re
+import time
+import uuid
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+CHAPTER_FILE = re.compile(r"^chapter_(\d+)\.txt$")
+
+
+def chapter_files(base_dir):
+    """The prose chapter files (chapter_01.txt, chapter_02.txt...) in chapter order."""
+    found = []
+    for name in os.listdir(base_dir):
+        match = CHAPTER_FILE.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(base_dir, name)))
+    return [path for _, path in sorted(found)]
+
+
+def clean_title(title):
+    # Models sometimes add chatter after the title line; only the first line is the title
+    title = next((line for line in (title or "").splitlines() if line.strip()), "").strip()
+    return re.sub(r"^title:\s*", "", title, flags=re.IGNORECASE).strip() or "Untitled"
+
+
+def chapter_heading(path, number):
+    """A chapter's first line if it reads like a heading, otherwise just 'Chapter N'."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip().strip('#*').strip()
+            if line:
+                return line if len(line) <= 80 and not line.endswith(('.', ',')) else f"Chapter {number}"
+    return f"Chapter {number}"
+
+
+def headings_toc(paths):
+    return "\n".join(f"Chapter {number}: {chapter_heading(path, number)}" for number, path in enumerate(paths, start=1))
+
+
+def copy_in_chunks(path, write):
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            write(chunk)
+
+
+def paragraphs(path):
+    """Yields one paragraph (run of non-blank lines) at a time."""
+    lines = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                lines.append(line)
+            elif lines:
+                yield " ".join(lines)
+                lines = []
+    if lines:
+        yield " ".join(lines)
+
+
+def export_text(out, title, toc, paths):
+    out.write(f"Title: {title}\n\nTable of Contents:\n{toc}\n\n")
+    for number, path in enumerate(paths, start=1):
+        out.write(f"\nChapter {number}:\n\n")
+        copy_in_chunks(path, out.write)
+        out.write("\n")
+
+
+def export_markdown(out, title, toc, paths):
+    out.write(f"# {title}\n\n## Table of Contents\n\n{toc}\n\n")
+    for number, path in enumerate(paths, start=1):
+        out.write(f"\n## Chapter {number}\n\n")
+        copy_in_chunks(path, out.write)
+        out.write("\n")
+
+
+def write_html_body(write, paths):
+    for number, path in enumerate(paths, start=1):
+        write(f'<section id="chapter-{number}">\n<h2>Chapter {number}</h2>\n')
+        for paragraph in paragraphs(path):
+            write(f"<p>{html.escape(paragraph)}</p>\n")
+        write("</section>\n")
+
+
+def export_html(out, title, toc, paths):
+    out.write(
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>{html.escape(title)}</title>\n</head>\n<body>\n<h1>{html.escape(title)}</h1>\n"
+        "<nav>\n<h2>Table of Contents</h2>\n<ol>\n"
+    )
+    for number, line in enumerate(toc_lines(toc, len(paths)), start=1):
+        out.write(f'<li><a href="#chapter-{number}">{html.escape(line)}</a></li>\n')
+    out.write("</ol>\n</nav>\n")
+    write_html_body(out.write, paths)
+    out.write("</body>\n</html>\n")
+
+
+def toc_lines(toc, count):
+    """One label per chapter: the lines of 'toc' that mention a chapter, padded to 'count'."""
+    lines = [line.strip(" -*\t") for line in (toc or "").splitlines()]
+    lines = [line for line in lines if re.match(r"(chapter|ch\.)\s*\d+", line, re.IGNORECASE)]
+    return [lines[i] if i < len(lines) else f"Chapter {i + 1}" for i in range(count)]
+
+
+def export_epub(path, title, toc, paths):
+    """Writes an EPUB 3 file entry by entry, streaming each chapter straight into the zip."""
+    book_id = f"urn:uuid:{uuid.uuid4()}"
+    labels = toc_lines(toc, len(paths))
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as book:
+        # The mimetype entry has to come first and be stored uncompressed
+        book.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        book.writestr("META-INF/container.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>\n'
+            '</container>\n'
+        ))
+
+        manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        spine = []
+        nav = []
+        for number, chapter_path in enumerate(paths, start=1):
+            name = f"chapter_{number:03d}.xhtml"
+            manifest.append(f'<item id="ch{number}" href="{name}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="ch{number}"/>')
+            nav.append(f'<li><a href="{name}">{html.escape(labels[number - 1])}</a></li>')
+            with book.open(f"OEBPS/{name}", 'w') as entry:
+                def write(text, entry=entry):
+                    entry.write(text.encode('utf-8'))
+                write(xhtml_head(f"Chapter {number}"))
+                write(f"<h2>Chapter {number}</h2>\n")
+                for paragraph in paragraphs(chapter_path):
+                    write(f"<p>{html.escape(paragraph)}</p>\n")
+                write("</body>\n</html>\n")
+
+        book.writestr("OEBPS/nav.xhtml", (
+            xhtml_head("Table of Contents", epub_namespace=True)
+            + f"<h1>{html.escape(title)}</h1>\n<nav epub:type=\"toc\" id=\"toc\">\n<h2>Table of Contents</h2>\n<ol>\n"
+            + "\n".join(nav) + "\n</ol>\n</nav>\n</body>\n</html>\n"
+        ))
+        book.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">\n'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+            f'<dc:identifier id="book-id">{book_id}</dc:identifier>\n'
+            f'<dc:title>{html.escape(title)}</dc:title>\n'
+            '<dc:language>en</dc:language>\n'
+            f'<meta property="dcterms:modified">{time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}</meta>\n'
+            '</metadata>\n'
+            '<manifest>\n' + "\n".join(manifest) + '\n</manifest>\n'
+            '<spine>\n' + "\n".join(spine) + '\n</spine>\n'
+            '</package>\n'
+        ))
+
+
+def xhtml_head(title, epub_namespace=False):
+    namespace = ' xmlns:epub="http://www.idpf.org/2007/ops"' if epub_namespace else ""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        f'<html xmlns="http://www.w3.org/1999/xhtml"{namespace}>\n'
+        f'<head><meta charset="utf-8"/><title>{html.escape(title)}</title></head>\n<body>\n'
+    )
+
+
+TEXT_EXPORTERS = {
+    "txt": ("compiled_book.txt", export_text),
+    "md": ("compiled_book.md", export_markdown),
+    "html": ("compiled_book.html", export_html),
+}
+FORMATS = tuple(TEXT_EXPORTERS) + ("epub",)
+
+
+def compile_book(base_dir, title, toc, formats=("txt",), toc_from_headers=False, num_chapters=None):
+    """
+    Builds the book from the chapter files on disk, one chunk or paragraph at a time, so
+    memory stays flat however long the book is. Each output is written to a temporary
+    file and renamed into place. Returns the paths written.
+    """
+    paths = chapter_files(base_dir)
+    if num_chapters is not None:
+        paths = paths[:num_chapters]
+    title = clean_title(title)
+    if toc_from_headers or not toc:
+        toc = headings_toc(paths)
+
+    written = []
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'. Pick from: {', '.join(FORMATS)}.")
+        filename = "compiled_book.epub" if fmt == "epub" else TEXT_EXPORTERS[fmt][0]
+        target = os.path.join(base_dir, filename)
+        temp_path = target + '.tmp'
+        if fmt == "epub":
+            export_epub(temp_path, title, toc, paths)
+        else:
+            with open(temp_path, 'w', encoding='utf-8') as out:
+                TEXT_EXPORTERS[fmt][1](out, title, toc, paths)
+        os.replace(temp_path, target)
+        written.append(target)
+    return written
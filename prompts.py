@@ -0,0 +1,192 @@
+import string
+import threading
+
+from story_memory import count_tokens
+
+# Every prompt of a book starts with this system message, byte for byte the same, so
+# llama.cpp / vLLM / LM Studio can keep its KV cache and skip most of the prefill.
+# Only things that stay fixed for the whole book belong here.
+SHARED_INSTRUCTIONS = (
+    "You are an experienced novelist's assistant working on one book, described in the book bible below. "
+    "Stay consistent with the bible in every answer. Each request starts with your task for that step: "
+    "follow it closely and output only what it asks for, without commentary or dialogue with the reader."
+)
+BIBLE_FIELDS = (("story_idea", "Story idea"), ("tone", "Tone"), ("premise", "Premise"))
+
+
+class PromptTemplate:
+    """
+    One step's prompt: fixed task instructions followed by a request with {fields}.
+    The text is parsed once, when the template is registered, into literal pieces and
+    field names, so rendering is a plain join and a missing field fails straight away.
+    """
+    def __init__(self, name, instructions, request):
+        self.name = name
+        self.instructions = instructions
+        self.pieces = []
+        self.fields = set()
+        for literal, field, spec, conversion in string.Formatter().parse(request):
+            if spec or conversion:
+                raise ValueError(f"Template '{name}': format specs aren't supported ({{{field}}}).")
+            self.pieces.append((literal, field))
+            if field is not None:
+                if not field.isidentifier():
+                    raise ValueError(f"Template '{name}': '{{{field}}}' is not a plain field name.")
+                self.fields.add(field)
+
+    def render(self, values):
+        missing = self.fields - set(values)
+        if missing:
+            raise KeyError(f"Template '{self.name}' needs: {', '.join(sorted(missing))}")
+        return "".join(literal + (str(values[field]) if field is not None else "") for literal, field in self.pieces)
+
+
+TEMPLATES = {}
+
+
+def register(name, instructions, request):
+    TEMPLATES[name] = PromptTemplate(name, instructions, request)
+    return TEMPLATES[name]
+
+
+register(
+    "premise",
+    "Create a compelling premise for a story. The premise should include (1) a protagonist described with an adjective and a noun, (2) their primary goal, (3) the central situation or crisis they face, and (4) a unique element or 'special sauce' that sets the story apart. This unique element could be a fresh perspective, a distinctive character voice, or an intriguing take on current events. Ensure the premise is concise yet captures the essence of the story idea and tone.",
+    "Generate a premise that includes the required elements to outline the story's foundation, based on the story idea and the tone in the book bible.",
+)
+register(
+    "title",
+    "You are an expert in crafting intriguing titles for stories. Please provide the title in the format: Title: <title_placeholder>. you only output the title.",
+    "Write 1 perfect title for the book using the format Title: <title_placeholder>. based on the premise, the story idea and the tone in the book bible.",
+)
+register(
+    "toc",
+    "You are tasked with generating a table of contents. An excellent table of contents provides clear, concise, and descriptive chapter titles that give readers a glimpse of the chapter's content while invoking curiosity. The titles should be consistent in tone and style, and they should align with the overarching theme of the story.",
+    "Please follow the format: Table of Content: Chapter 1: <Title>, Chapter 2: <Title>, ... up to {num_chapters} chapters. Generate this table for {num_chapters} chapters based on the premise, the story idea and the tone in the book bible.",
+)
+register(
+    "content_types",
+    "You're tasked with enriching an existing table of contents by adding a brief content type description next to each chapter title. Your additions should provide insights into the key events or themes of each chapter without changing the original titles. Use the format: [Original Chapter Title] - [Content Type]. Focus on incorporating content types that reflect significant plot events, character development, and thematic elements, ensuring they align with the story's tone. Be concise and avoid modifying the chapter titles.",
+    "Below is the table of contents for the story. For each chapter, add a content type description next to the original title using the specified format. Ensure your additions enhance understanding of the chapter's focus without altering the titles.\n\n{toc}",
+)
+register(
+    "refined_content_types",
+    "Refine the initial content types to ensure a coherent narrative and depth. Focus on a logical sequence of events, natural character development, seamless integration of background information, and avoidance of unnecessary details. Maintain consistency with the tone. Use bullet points or succinct phrases for clarity.",
+    "Given the initial content types:\n\n{content_types}\n\nrefine and deepen the details for each chapter, using bullet points or succinct phrases. Adhere to the instructions.",
+)
+register(
+    "deepened_narrative",
+    "Elevate the narrative by enriching the refined content types. Focus on expanding crucial plot points, introducing nuanced character dynamics, building tension and conflicts, and smoothly leading towards the climax and resolution. Ensure the details added are pertinent and impactful, and keep everything aligned with the tone. Depth should add to the story's richness without becoming verbose. Maintain the format provided and enhance each chapter's narrative comprehensively.",
+    "Expand the narrative for each chapter using the refined content types:\n\n{refined_content_types}\n\nConsider the premise and the tone as you develop the story further. Add depth and detail to each chapter, following the guidelines above.",
+)
+register(
+    "first_outline",
+    "Outline the key events in Chapter 1 using a concise timeline outtline events . Focus on pivotal moments that introduce characters, setting, and the initial conflict. Keep descriptions brief and to the point.",
+    "Chapter 1 content:\n\n{chapter_content}\n\nGenerate a concise outtline events that includes:\n\n- Event: Description (1-2 sentences)\n- Character introduction and development\n- Initial conflict introduction\n- Setting introduction\n\nEnsure clarity and brevity in each point.",
+)
+register(
+    "outline",
+    "Create a concise timeline outline story only for the chapter you are given, detailing how it progresses the story. Highlight new events, character arcs, and conflicts, ensuring no repetition from previous chapters.",
+    "Given Chapter {chapter_number}'s content:\n\n{chapter_content}\n\nCraft a focused timeline  outline events  covering:\n\n- Major events with brief descriptions\n- Character developments\n- New conflicts or escalations\n- Integration of themes\n\nReference from previous chapter's outline:\n\n{previous_outline}\n\nWhat happened earlier in the story:\n\n{earlier_story}\n\nAim for succinctness and specificity.",
+)
+register(
+    "first_chapter",
+    "As an expert narrative writer, you are tasked with crafting the opening chapter of a novel. This chapter must embody the book's tone, capturing the essence of the story's beginning as outlined. Your objective is to transform the provided chapter outline into engaging and coherent narrative prose. Focus on developing the scenes, actions, dialogues, and character emotions detailed in the outline, ensuring a rich and immersive reading experience. The final output should present a seamless narrative that adheres closely to the outline, emphasizing storytelling over conversation or extraneous details.",
+    "Based on the outline provided below, write a detailed narrative for Chapter 1. The narrative should vividly bring the outline to life, aligning closely with both the story's premise and the specified tone. Your narrative should include only the story content as informed by the outline, without deviating into unrelated discussions or dialogue with the reader.\n\nOutline for Chapter 1:\n\n{outline}\n\n.",
+)
+register(
+    "chapter",
+    "As a skilled narrative writer, your task is to write one chapter of a novel, ensuring it is infused with the book's tone. This chapter must seamlessly continue the story from the previous chapters, based solely on the provided outline. Your goal is to craft a narrative that is engaging, coherent, and true to the story's established direction. Focus on narrative development - including scenes, character dynamics, and plot progression - as indicated in the outline. Ensure the narrative is self-contained and consistent with the story's overarching themes and character arcs.",
+    "Using the outline for Chapter {chapter_number} below, craft a detailed narrative that effectively continues the story. This narrative should adhere to the specified tone and align with the overarching story arc, without assuming additional context not present in the outline. Ensure the chapter contributes meaningfully to the narrative progression and character development outlined thus far.\n\nOutline for Chapter {chapter_number}:\n\n{outline}\n\n.",
+)
+register(
+    "scene",
+    "As a skilled narrative writer, your task is to write one scene of a chapter of a novel, ensuring it is infused with the book's tone. Write only the scene you are given, as engaging and coherent narrative prose, so that it flows naturally from the scene before it and into the scene after it. Do not summarise, do not add headings, and do not address the reader.",
+    "Write scene {scene_number} of {scene_count} of Chapter {chapter_number}, about {scene_words} words, covering these beats:\n\n{beats}\n\nThe previous scene covered: {previously}\nThe next scene will cover: {coming_next}\n\nWrite only this scene.",
+)
+register(
+    "revision",
+    "You are a meticulous revision specialist, skilled in refining content based on feedback. Your primary goal is to enhance the original content while preserving its core essence. It's crucial to avoid chatbot-like behavior and only focus on the task of revision.",
+    "Given the detailed feedback: '{feedback}', and the context: '{context}', adeptly refine the following content without straying from the feedback's intent: '{original_content}'. Ensure the revised content is clear and concise without any additional commentary.",
+)
+
+
+class PromptBook:
+    """
+    Renders the registered templates for one book. Each prompt is laid out as
+    [system: shared instructions + book bible] [user: task instructions, then the request],
+    so the system message is a prefix the server has seen before. The task instructions
+    differ from step to step and the pipeline alternates steps, so only the system
+    message is counted as reusable, and only once it has been sent before.
+    shared_prefix=False puts the per-call request first instead (the way the prompts used
+    to be ordered), which is only useful to measure what the shared prefix saves.
+    """
+    def __init__(self, shared_prefix=True, templates=None):
+        self.shared_prefix = shared_prefix
+        self.templates = templates if templates is not None else TEMPLATES
+        self.bible = {}
+        self._lock = threading.Lock()
+        self._prefix_tokens = {}  # system message -> tokens, counted once it has been sent
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.reusable_tokens = 0
+
+    def update(self, **fields):
+        """Fills in the book bible; fields left as None keep their current value."""
+        with self._lock:
+            self.bible.update({key: value.strip() for key, value in fields.items() if value})
+
+    def system_message(self):
+        with self._lock:
+            bible = dict(self.bible)
+        lines = [f"{label}: {bible[key]}" for key, label in BIBLE_FIELDS if bible.get(key)]
+        return SHARED_INSTRUCTIONS + "\n\nBook bible:\n" + "\n".join(lines)
+
+    def messages(self, name, **values):
+        template = self.templates[name]
+        system = self.system_message()
+        request = template.render(values)
+        if self.shared_prefix:
+            user = template.instructions + "\n\n" + request
+            messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+        else:
+            messages = [{"role": "user", "content": request + "\n\n" + template.instructions + "\n\n" + system}]
+        self._count(system, sum(count_tokens(m["content"]) for m in messages))
+        return messages
+
+    def _count(self, system, prompt_tokens):
+        # The first prompt with a new bible has to be prefilled in full; after that the
+        # system message is what the server can skip (a few more cold starts with several
+        # endpoints, which is close enough for a share)
+        with self._lock:
+            seen = system in self._prefix_tokens
+        reusable = 0
+        if self.shared_prefix:
+            reusable = self._prefix_tokens[system] if seen else count_tokens(system)
+        with self._lock:
+            self._prefix_tokens[system] = reusable
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            if seen:
+                self.reusable_tokens += min(reusable, prompt_tokens)
+
+    def prefix_tokens(self):
+        """Tokens of the shared system message, the prefix every prompt of the book starts with."""
+        return count_tokens(self.system_message()) if self.shared_prefix else 0
+
+    def stats(self):
+        with self._lock:
+            calls, prompt_tokens, reusable = self.calls, self.prompt_tokens, self.reusable_tokens
+        return {
+            "prompts": calls,
+            "shared_prefix_tokens": self.prefix_tokens(),
+            "prompt_tokens": prompt_tokens,
+            "reusable_tokens": reusable,
+            "reusable_share": reusable / prompt_tokens if prompt_tokens else 0.0,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"Prompt prefix: {stats['shared_prefix_tokens']} tokens shared by every prompt; "
+                f"{stats['reusable_share']:.0%} of the {stats['prompt_tokens']} prompt tokens in "
+                f"{stats['prompts']} prompts were a system message the server had already seen.")
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class RunManifest:
+    """
+    A per-book record of every generation step: its status, a hash of the prompt that
+    produced it, the output file, how many attempts it took, latency and token counts.
+    The file is rewritten atomically after each change, so a crash never leaves it
+    half-written. A resumed run skips steps that are 'done' with an unchanged prompt
+    and an output file still on disk, and re-runs everything else.
+    """
+    def __init__(self, path, fresh=False):
+        self.path = path
+        self.steps = {}
+        self._lock = threading.Lock()
+        if not fresh and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.steps = json.load(f).get("steps", {})
+
+    @staticmethod
+    def hash_input(messages):
+        payload = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def is_fresh(self, step, input_hash):
+        with self._lock:
+            record = self.steps.get(step)
+        if not record or record.get("status") != "done" or record.get("input_hash") != input_hash:
+            return False
+        output = record.get("output")
+        return bool(output) and os.path.exists(os.path.join(os.path.dirname(self.path), output))
+
+    def changed(self, step, input_hash):
+        """True when the step was last run from a known prompt other than 'input_hash'."""
+        with self._lock:
+            record = self.steps.get(step)
+        return bool(record) and record.get("input_hash") is not None and record.get("input_hash") != input_hash
+
+    def start(self, step, input_hash, output):
+        self._update(step, status="running", input_hash=input_hash, output=output, error=None, started=time.time())
+
+    def finish(self, step, attempts=1, latency=None, prompt_tokens=None, completion_tokens=None, cached=False):
+        self._update(step, status="done", attempts=attempts, latency=latency, prompt_tokens=prompt_tokens,
+                     completion_tokens=completion_tokens, cached=cached, finished=time.time())
+
+    def fail(self, step, error, attempts=None):
+        self._update(step, status="failed", error=str(error), attempts=attempts, finished=time.time())
+
+    def failed_steps(self):
+        with self._lock:
+            return [step for step, record in self.steps.items() if record.get("status") != "done"]
+
+    def _update(self, step, **fields):
+        with self._lock:
+            self.steps.setdefault(step, {}).update(fields)
+            self._save()
+
+    def _save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"updated": time.time(), "steps": self.steps}, f, indent=2)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,177 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+try:
+    import tiktoken  # Optional: a real tokenizer gives tighter budgets than the character estimate
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# Rough characters-per-token for English prose when no tokenizer is installed
+CHARS_PER_TOKEN = 4
+
+# Capitalised words that start sentences or headings far more often than they name anyone
+NOT_NAMES = {
+    "A", "An", "The", "And", "But", "Or", "So", "Then", "When", "While", "As", "At", "In", "On",
+    "Of", "To", "For", "With", "From", "After", "Before", "During", "Meanwhile", "Later", "Finally",
+    "He", "She", "They", "It", "We", "I", "His", "Her", "Their", "Its", "This", "That", "These",
+    "Those", "There", "Here", "What", "Who", "Why", "How", "Chapter", "Event", "Events", "Setting",
+    "Character", "Characters", "Conflict", "Conflicts", "Theme", "Themes", "Outline", "Timeline",
+    "Description", "Introduction", "Development", "Major", "New", "Initial", "Integration", "Part",
+    "Section", "Scene", "Title", "Table", "Contents",
+}
+
+NAME_PATTERN = re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, budget, keep="head"):
+    """
+    Cuts 'text' down to at most 'budget' tokens, keeping its start (keep="head") or
+    its end (keep="tail"). A marker shows where something was dropped.
+    """
+    if not text or budget <= 0:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    marker = " [...]"
+    room = max(budget - count_tokens(marker), 1)
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text)
+        kept = _ENCODING.decode(tokens[:room] if keep == "head" else tokens[-room:])
+    else:
+        chars = room * CHARS_PER_TOKEN
+        kept = text[:chars] if keep == "head" else text[-chars:]
+    return kept + marker if keep == "head" else marker.strip() + " " + kept
+
+
+def fit_texts(items, budget):
+    """
+    Shares 'budget' tokens between several texts. 'items' is a list of (text, share):
+    each text is first held to its share of the budget, then whatever the short ones
+    leave over goes to the texts that were cut, in list order. Returns the cut texts.
+    """
+    texts = [text or "" for text, _ in items]
+    limits = [int(budget * share) for _, share in items]
+    sizes = [count_tokens(text) for text in texts]
+    spare = budget - sum(min(size, limit) for size, limit in zip(sizes, limits))
+    for index, (size, limit) in enumerate(zip(sizes, limits)):
+        if size > limit and spare > 0:
+            extra = min(size - limit, spare)
+            limits[index] += extra
+            spare -= extra
+    return [truncate_to_tokens(text, limit) for text, limit in zip(texts, limits)]
+
+
+def assemble_sections(sections, budget):
+    """Fits labelled (label, text, share) sections into one block of at most 'budget' tokens."""
+    headers = sum(count_tokens(f"{label}:\n\n\n\n") for label, _, _ in sections)
+    texts = fit_texts([(text, share) for _, text, share in sections], max(budget - headers, 0))
+    return "\n\n".join(f"{label}:\n\n{text}" for (label, _, _), text in zip(sections, texts) if text)
+
+
+def first_sentences(text, count):
+    lines = [line.strip(" -*#\t") for line in text.splitlines()]
+    flat = " ".join(line for line in lines if line)
+    return " ".join(SENTENCE_END.split(flat)[:count])
+
+
+class StoryMemory:
+    """
+    A compact, bounded picture of the story so far, so later prompts don't have to carry
+    every earlier outline in full. For each chapter it keeps a short digest and the names
+    it mentions; from those it builds a rolling summary of older chapters, a ledger of
+    recurring characters and places, and the digests of the last few chapters.
+    Everything is derived from what was recorded, so re-recording a chapter is harmless.
+    """
+    def __init__(self, path=None, recent_chapters=2, digest_sentences=4, summary_tokens=400, ledger_size=15):
+        self.path = path
+        self.recent_chapters = recent_chapters
+        self.digest_sentences = digest_sentences
+        self.summary_tokens = summary_tokens
+        self.ledger_size = ledger_size
+        self.digests = {}
+        self.names = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self.digests = {int(k): v for k, v in saved.get("digests", {}).items()}
+            self.names = {int(k): v for k, v in saved.get("names", {}).items()}
+
+    def record_chapter(self, chapter_number, text):
+        if not text:
+            return
+        names = Counter(
+            match for match in NAME_PATTERN.findall(text)
+            if match.split()[0] not in NOT_NAMES
+        )
+        with self._lock:
+            self.digests[chapter_number] = first_sentences(text, self.digest_sentences)
+            self.names[chapter_number] = dict(names)
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"digests": self.digests, "names": self.names}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+    def rolling_summary(self, before_chapter):
+        """One line per chapter older than the recent window, newest kept when over budget."""
+        cutoff = before_chapter - self.recent_chapters
+        with self._lock:
+            lines = [f"Ch {n}: {first_sentences(self.digests[n], 1)}" for n in sorted(self.digests) if n < cutoff]
+        kept = []
+        used = 0
+        for line in reversed(lines):
+            cost = count_tokens(line) + 1
+            if used + cost > self.summary_tokens:
+                break
+            kept.append(line)
+            used += cost
+        return "\n".join(reversed(kept))
+
+    def ledger(self, before_chapter):
+        totals = Counter()
+        first_seen = {}
+        with self._lock:
+            for n in sorted(self.names):
+                if n >= before_chapter:
+                    continue
+                for name, count in self.names[n].items():
+                    totals[name] += count
+                    first_seen.setdefault(name, n)
+        return "\n".join(
+            f"- {name} (since ch {first_seen[name]})"
+            for name, _ in totals.most_common(self.ledger_size)
+        )
+
+    def recent(self, before_chapter):
+        with self._lock:
+            return "\n".join(
+                f"Ch {n}: {self.digests[n]}"
+                for n in sorted(self.digests)
+                if before_chapter - self.recent_chapters <= n < before_chapter
+            )
+
+    def context_for(self, chapter_number, budget):
+        """Everything we remember before 'chapter_number', fitted into 'budget' tokens."""
+        return assemble_sections([
+            ("Recent chapters", self.recent(chapter_number), 0.45),
+            ("Story so far", self.rolling_summary(chapter_number), 0.35),
+            ("Recurring characters and places", self.ledger(chapter_number), 0.2),
+        ], budget)
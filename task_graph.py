@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Task:
+    """
+    One step of the book pipeline. 'inputs' names the tasks whose results this
+    step needs; they are handed to 'func' as positional arguments in that order.
+    The task's own result is stored under its name for whoever depends on it.
+    """
+    def __init__(self, name, func, inputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+
+
+class TaskGraph:
+    """
+    A small dependency-driven scheduler: every task whose inputs are ready is
+    started right away, so independent branches (chapter 3's prose and chapter
+    4's outline, for example) run side by side instead of in fixed phases.
+    """
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, func, inputs=()):
+        if name in self.tasks:
+            raise ValueError(f"Task '{name}' is declared twice.")
+        self.tasks[name] = Task(name, func, inputs)
+        return self.tasks[name]
+
+    def validate(self):
+        for task in self.tasks.values():
+            for dependency in task.inputs:
+                if dependency not in self.tasks:
+                    raise ValueError(f"Task '{task.name}' needs '{dependency}', which is not in the graph.")
+
+        # Kahn's algorithm: if we can't drain every task, something depends on itself
+        remaining = {name: len(task.inputs) for name, task in self.tasks.items()}
+        dependents = self._dependents()
+        ready = [name for name, count in remaining.items() if count == 0]
+        seen = 0
+        while ready:
+            name = ready.pop()
+            seen += 1
+            for dependent in dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if seen != len(self.tasks):
+            raise ValueError("The task graph has a cycle.")
+
+    def _dependents(self):
+        dependents = {name: [] for name in self.tasks}
+        for task in self.tasks.values():
+            for dependency in task.inputs:
+                dependents[dependency].append(task.name)
+        return dependents
+
+    def run(self, max_workers=4, on_start=None):
+        """
+        Runs the whole graph and returns {task name: result}. If a task raises,
+        everything that depends on it is skipped but unrelated branches still run
+        to the end (so one bad chapter doesn't cost the others); the first error is
+        re-raised once nothing is left to do.
+        """
+        self.validate()
+        results = {}
+        remaining = {name: len(task.inputs) for name, task in self.tasks.items()}
+        dependents = self._dependents()
+        ready = [name for name, count in remaining.items() if count == 0]
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            while ready or running:
+                while ready:
+                    task = self.tasks[ready.pop(0)]
+                    if on_start:
+                        on_start(task.name)
+                    args = [results[dependency] for dependency in task.inputs]
+                    running[executor.submit(task.func, *args)] = task.name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    results[name] = future.result()
+                    for dependent in dependents[name]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            ready.append(dependent)
+
+        if error is not None:
+            raise error
+        return results
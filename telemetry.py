@@ -0,0 +1,159 @@
+import json
+import math
+import os
+import threading
+import time
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+class Telemetry:
+    """
+    Records one event per LLM call (step, endpoint, cache status, latency, time to first
+    token, prompt and completion tokens) to a JSONL trace as it happens, and sums them up
+    per step at the end so it's clear which phase of the book the GPU time goes to.
+    """
+    def __init__(self, trace_path=None, prometheus_path=None):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.events = []
+        self._lock = threading.Lock()
+        self._trace = None
+        if trace_path:
+            self.open_trace(trace_path)
+
+    def open_trace(self, trace_path):
+        """Starts appending events to 'trace_path' (events recorded earlier are not replayed)."""
+        directory = os.path.dirname(trace_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+            self.trace_path = trace_path
+            self._trace = open(trace_path, 'a', encoding='utf-8')
+
+    def record(self, step, latency=None, prompt_tokens=None, completion_tokens=None, first_token=None,
+               endpoint=None, cache="miss", attempts=1, ok=True, error=None, queue_wait=None):
+        event = {
+            "time": round(time.time(), 3),
+            "step": step,
+            "endpoint": endpoint,
+            "cache": cache,
+            "ok": ok,
+            "attempts": attempts,
+            "latency": round(latency, 4) if latency is not None else None,
+            "first_token": round(first_token, 4) if first_token is not None else None,
+            # Time spent waiting for a free server slot, kept out of latency
+            "queue_wait": round(queue_wait, 4) if queue_wait is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+        if error is not None:
+            event["error"] = str(error)
+        with self._lock:
+            self.events.append(event)
+            if self._trace is not None:
+                self._trace.write(json.dumps(event) + "\n")
+                self._trace.flush()
+
+    def merge(self, other):
+        """Adds another Telemetry's events, e.g. to sum up every book of a batch."""
+        events = list(other.events)
+        with self._lock:
+            self.events.extend(events)
+
+    def summary(self):
+        """One row per step, in the order steps were first seen."""
+        with self._lock:
+            events = list(self.events)
+        steps = {}
+        for event in events:
+            steps.setdefault(event["step"], []).append(event)
+
+        rows = []
+        for step, step_events in steps.items():
+            generated = [e for e in step_events if e["ok"] and e["cache"] != "hit"]
+            latencies = [e["latency"] for e in generated if e["latency"] is not None]
+            first_tokens = [e["first_token"] for e in generated if e["first_token"] is not None]
+            # Calls the server sent no usage for are left out of the token sums, not counted as 0
+            prompt_tokens = [e["prompt_tokens"] for e in generated if e["prompt_tokens"] is not None]
+            counted = [e for e in generated if e["completion_tokens"] is not None]
+            completion_tokens = sum(e["completion_tokens"] for e in counted) if counted else None
+            counted_seconds = sum(e["latency"] or 0 for e in counted)
+            busy = sum(latencies)
+            rows.append({
+                "step": step,
+                "calls": len(step_events),
+                "cache_hits": sum(1 for e in step_events if e["cache"] == "hit"),
+                "failures": sum(1 for e in step_events if not e["ok"]),
+                "p50_latency": percentile(latencies, 0.5),
+                "p95_latency": percentile(latencies, 0.95),
+                "p50_first_token": percentile(first_tokens, 0.5),
+                "total_seconds": round(busy, 3),
+                "queue_seconds": round(sum(e.get("queue_wait") or 0 for e in generated), 3),
+                "prompt_tokens": sum(prompt_tokens) if prompt_tokens else None,
+                "completion_tokens": completion_tokens,
+                "tokens_per_sec": round(completion_tokens / counted_seconds, 1) if counted_seconds > 0 else None,
+            })
+        return rows
+
+    def format_summary(self):
+        def show(value, unit=""):
+            if value is None:
+                return "-"
+            return f"{value:.2f}{unit}" if isinstance(value, float) else f"{value}{unit}"
+
+        header = f"{'step':<24}{'calls':>7}{'hits':>6}{'fail':>6}{'p50':>9}{'p95':>9}{'ttft':>9}{'total':>10}{'queued':>10}{'prompt tok':>12}{'compl tok':>11}{'tok/s':>9}"
+        lines = [header, "-" * len(header)]
+        for row in self.summary():
+            lines.append(
+                f"{row['step']:<24}{row['calls']:>7}{row['cache_hits']:>6}{row['failures']:>6}"
+                f"{show(row['p50_latency'], 's'):>9}{show(row['p95_latency'], 's'):>9}{show(row['p50_first_token'], 's'):>9}"
+                f"{show(row['total_seconds'], 's'):>10}{show(row['queue_seconds'], 's'):>10}{show(row['prompt_tokens']):>12}{show(row['completion_tokens']):>11}"
+                f"{show(row['tokens_per_sec']):>9}"
+            )
+        return "\n".join(lines)
+
+    def write_prometheus(self, path=None):
+        """Writes the per-step totals in the Prometheus textfile-collector format."""
+        path = path or self.prometheus_path
+        if not path:
+            return
+        metrics = [
+            ("storysmith_llm_calls_total", "LLM calls per step", "counter", "calls"),
+            ("storysmith_llm_cache_hits_total", "Calls answered from the response cache", "counter", "cache_hits"),
+            ("storysmith_llm_failures_total", "Calls that failed after every retry", "counter", "failures"),
+            ("storysmith_llm_seconds_total", "Seconds spent waiting on generation", "counter", "total_seconds"),
+            ("storysmith_llm_queue_seconds_total", "Seconds spent waiting for a free server slot", "counter", "queue_seconds"),
+            ("storysmith_llm_prompt_tokens_total", "Prompt tokens sent", "counter", "prompt_tokens"),
+            ("storysmith_llm_completion_tokens_total", "Completion tokens received", "counter", "completion_tokens"),
+            ("storysmith_llm_latency_p50_seconds", "Median call latency", "gauge", "p50_latency"),
+            ("storysmith_llm_latency_p95_seconds", "95th percentile call latency", "gauge", "p95_latency"),
+        ]
+        rows = self.summary()
+        lines = []
+        for name, help_text, kind, field in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for row in rows:
+                if row[field] is not None:
+                    lines.append(f'{name}{{step="{row["step"]}"}} {row[field]}')
+        # Written aside and renamed so the collector never reads half a file
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None